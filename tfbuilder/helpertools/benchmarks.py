@@ -0,0 +1,757 @@
+# Benchmarks of the conversion machinery
+#
+# This file provides small benchmarks that compare the
+# current implementation of a conversion step with the
+# implementation it replaced (or with an alternative backend).
+# The replaced implementations are kept here as a reference only.
+#
+# Run all benchmarks from the tfbuilder directory with:
+#   python -m helpertools.benchmarks
+# or a single one with:
+#   python -m helpertools.benchmarks dataParser
+
+import sys
+import pickle
+import random
+import tempfile
+from os import path
+from time import perf_counter
+from multiprocessing import get_context
+from unicodedata import category, normalize
+
+# Local imports
+from helpertools.xmlparser import xmlSplitter, dataParser, tagLexer, \
+                                  attribClean, attribCleanCached, AttribCache, \
+                                  commentFullRE, commentStartRE, commentStopRE, \
+                                  bodyStartRE, bodyStopRE, xmlMetaRE, \
+                                  openTagRE, closeTagRE, opencloseTagRE, \
+                                  openAttrTagRE, closedAttrTagRE
+from greek_normalisation.normalise import Normaliser
+from helpertools.cache import LRUCache
+from helpertools.scheduler import simulateMakespan, idealMakespan
+from helpertools.langtools import Greek
+from helpertools.lemmatizer import writeLemmaIndex, LemmaIndex, shareLemmatizer, writeFuzzyIndex
+from helpertools.unicodetricks import udnorm, letter, space, letter_dia, splitPunc, cleanWords, splitPuncArray, \
+                                     plainLow, plainCaps, stripAccents
+from data.attrib_errors import error_dict
+from tf_config import langsettings
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CORPUS_DIR = path.dirname(path.abspath(__file__))
+CORPUS = [path.join(CORPUS_DIR, f) for f in ('20001.xml', '20004_clean.xml')]
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    '''Runs func(*args, **kwargs) repeat times and
+    returns a tuple with the result of the last run
+    and the fastest time in seconds: (result, seconds)
+    '''
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        res = func(*args, **kwargs)
+        seconds = perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return res, best
+
+
+def report(name, before, after, unit):
+    '''Prints the number of units/second before and after'''
+    print(f'{name:<24}{before:>14,.0f} {unit}/s{after:>14,.0f} {unit}/s'
+          f'{after / before if before else 0:>8.2f}x')
+
+
+# REFERENCE IMPLEMENTATIONS
+def cascadeParser(data, lang='generic'):
+    '''The dataParser as it was before tagLexer: every
+    element is tested against the XML RE PATTERNS in turn.
+    '''
+    parsed_data = []
+    comment     = False
+
+    for elem in data:
+        if comment:
+            if commentStopRE.fullmatch(elem):
+                comment = False
+            code, content = 'comment', ''
+        else:
+            if commentFullRE.fullmatch(elem):
+                code, content = 'comment', ''
+            elif commentStartRE.fullmatch(elem):
+                comment = True
+                code, content = 'comment', ''
+            elif bodyStartRE.fullmatch(elem):
+                code, content = 'bodyStart', ''
+            elif bodyStopRE.fullmatch(elem):
+                code, content = 'bodyStop', ''
+            elif xmlMetaRE.fullmatch(elem):
+                code, content = 'comment', ''
+            elif openTagRE.fullmatch(elem):
+                code, content = 'openTag', elem.strip('<> ')
+            elif closeTagRE.fullmatch(elem):
+                code, content = 'closeTag', elem.strip('<>/ ')
+            elif opencloseTagRE.fullmatch(elem):
+                code, content = 'openCloseTag', elem.strip('<>/ ')
+            elif openAttrTagRE.fullmatch(elem):
+                code = 'openAttrTag'
+                content = attribClean(elem, error_dict, lang=lang, **langsettings)
+            elif closedAttrTagRE.fullmatch(elem):
+                code = 'closedAttrTag'
+                content = attribClean(elem, error_dict, lang=lang, **langsettings)
+            elif elem.strip() == '':
+                code, content = None, elem
+            else:
+                code, content = 'text', elem
+        parsed_data.append((code, content))
+    return parsed_data
+
+
+def recursiveSplitPunc(words, norm=udnorm, clean=False,
+                       splitters=None, non_splitters=None):
+    '''The recursive splitPunc as it was before it
+    was made iterative.
+    '''
+    if splitters is None:
+        splitters = ()
+    if non_splitters is None:
+        non_splitters = ()
+    w = normalize(norm, words)
+    pP = 0
+    for i in range(len(w)):
+        if category(w[i]) in space and pP > 0:
+            pP += 1
+            preWord = w[0:pP].strip('\n')
+            if preWord:
+                rest = recursiveSplitPunc(w[pP:], clean=clean, splitters=splitters,
+                                          non_splitters=non_splitters) if pP < len(w) else ()
+                return ((preWord, '', ''),) + rest
+            else:
+                continue
+        elif category(w[i]) not in letter_dia:
+            pP += 1
+        else:
+            break
+    preWord = w[0:pP].strip('\n') if pP else ''
+    pW = pP
+    for i in range(pP, len(w)):
+        if w[i] in non_splitters:
+            break
+        elif category(w[i]) in letter_dia:
+            pW += 1
+        else:
+            break
+    word = w[pP:pW]
+    pA = pW
+    nsplit = False
+    spaceBreak = False
+    sLoc = None
+    for i in range(pW, len(w)):
+        if clean:
+            if spaceBreak:
+                if not category(w[i]) in letter_dia:
+                    pA += 1
+                    if category(w[i]) in space:
+                        sLoc = pA
+                else:
+                    break
+            elif category(w[i]) in space:
+                pA += 1
+                spaceBreak = True
+                sLoc = pA
+            elif w[i] in splitters:
+                pA += 1
+                break
+            elif category(w[i]) in letter_dia:
+                pW = i + 1
+                pA = pW
+                word += w[i]
+            elif category(w[i]) not in letter_dia:
+                pA += 1
+        else:
+            if spaceBreak:
+                if not category(w[i]) in letter_dia:
+                    pA += 1
+                    if category(w[i]) in space:
+                        sLoc = pA
+                else:
+                    break
+            elif category(w[i]) in space:
+                pA += 1
+                spaceBreak = True
+                sLoc = pA
+            elif w[i] in non_splitters:
+                nsplit = True
+                continue
+            elif category(w[i]) not in letter_dia:
+                nsplit = False
+                pA += 1
+            elif category(w[i]) in letter_dia and nsplit == True:
+                pW = i + 1
+                pA = pW
+                word += w[i]
+            else:
+                break
+    if not sLoc:
+        sLoc = pA
+    afterWord = w[pW:sLoc].strip('\n')
+    rest = recursiveSplitPunc(w[sLoc:], clean=clean, splitters=splitters,
+                              non_splitters=non_splitters) if sLoc < len(w) else ()
+    return ((preWord, word, afterWord),) + rest
+
+
+def recursiveCleanWords(words, norm=udnorm, clean=False,
+                        splitters=None, non_splitters=None):
+    '''The recursive cleanWords as it was before it
+    was made iterative.
+    '''
+    if splitters is None:
+        splitters = ()
+    if non_splitters is None:
+        non_splitters = ()
+    w = normalize(norm, words)
+    pP = 0
+    for i in range(len(w)):
+        if category(w[i]) not in letter_dia:
+            pP += 1
+        else:
+            break
+    pW = pP
+    for i in range(pP, len(w)):
+        if category(w[i]) in letter_dia:
+            pW += 1
+        else:
+            break
+    realWord = w[pP:pW]
+    pA = pW
+    nsplit = False
+    for i in range(pW, len(w)):
+        if clean:
+            if category(w[i]) in space:
+                break
+            elif w[i] in splitters:
+                break
+            elif category(w[i]) not in letter_dia:
+                pA += 1
+            elif category(w[i]) in letter_dia:
+                realWord += w[i]
+                pA += 1
+        else:
+            if w[i] in non_splitters:
+                nsplit = True
+                continue
+            elif category(w[i]) in letter_dia and nsplit == True:
+                pW = i + 1
+                pA = pW
+                realWord += w[i]
+            elif category(w[i]) not in letter_dia:
+                nsplit = False
+                pA += 1
+            else:
+                break
+    res = (realWord,) + \
+          (recursiveCleanWords(w[pA:], norm=udnorm, clean=clean,
+                               splitters=splitters, non_splitters=non_splitters)
+           if pA < len(w) else ())
+    return res if not res == ('',) else ()
+
+
+# BENCHMARKS
+def benchDataParser(corpus=CORPUS, lang='greek'):
+    '''Events/second of the regex cascade (before)
+    and of dataParser with tagLexer (after).
+    '''
+    data = [elem for file in corpus for elem in xmlSplitter(file)]
+    before, t_before = timed(cascadeParser, data, lang=lang)
+    after, t_after = timed(lambda: list(dataParser(data, lang=lang)))
+    assert before == after, 'dataParser does not produce the same events'
+    report('dataParser', len(before) / t_before, len(after) / t_after, 'events')
+
+
+def benchAttribClean(corpus=CORPUS, lang='greek'):
+    '''Tags/second of attribClean (before) and of
+    attribCleanCached with an empty cache (after).
+    '''
+    tags = [elem for file in corpus for elem in xmlSplitter(file)
+            if elem.startswith('<') and tagLexer(elem) in ('openAttrTag', 'closedAttrTag')]
+    cache = AttribCache()
+    before, t_before = timed(lambda: [attribClean(t, error_dict, lang=lang, **langsettings)
+                                      for t in tags])
+    after, t_after = timed(lambda: cache.clear() or [attribCleanCached(t, error_dict, lang=lang,
+                                                                       cache=cache, **langsettings)
+                                                     for t in tags])
+    assert before == after, 'attribCleanCached does not produce the same attributes'
+    report('attribClean', len(tags) / t_before, len(tags) / t_after, 'tags')
+    print(f'{"":<24}cache: {cache.info()}')
+
+
+def categoryPlainLow(word):
+    '''plainLow as it was before CLASS_TABLE'''
+    return ''.join(c.lower() for c in
+                   normalize('NFD', word)
+                   if category(c) in letter)
+
+
+def categoryPlainCaps(word):
+    '''plainCaps as it was before CLASS_TABLE'''
+    return ''.join(c.upper() for c in
+                   normalize('NFD', word)
+                   if category(c) in letter)
+
+
+def categoryStripAccents(word):
+    '''stripAccents as it was before CLASS_TABLE'''
+    return ''.join(c for c in normalize('NFD', word.lower())
+                   if category(c) in letter)
+
+
+def benchTokenizer(corpus=CORPUS, node_len=1000):
+    '''Characters/second of the recursive (before) and iterative (after)
+    splitPunc and cleanWords on text nodes of node_len characters.
+    The recursive functions also use category() instead of CLASS_TABLE.
+    NB the recursive functions cannot handle much longer nodes.
+    '''
+    text = corpusText(corpus)
+    nodes = [text[i:i + node_len] for i in range(0, len(text), node_len)]
+    for new, old in ((splitPunc, recursiveSplitPunc), (cleanWords, recursiveCleanWords)):
+        before, t_before = timed(lambda: [old(n, norm='NFD') for n in nodes])
+        after, t_after = timed(lambda: [new(n, norm='NFD') for n in nodes])
+        assert before == after, f'{new.__name__} differs from its predecessor'
+        report(new.__name__, len(text) / t_before, len(text) / t_after, 'chars')
+
+
+def corpusText(corpus=CORPUS):
+    return ' '.join(content for file in corpus
+                    for code, content in dataParser(xmlSplitter(file)) if code == 'text')
+
+
+def benchCharClasses(corpus=CORPUS):
+    '''Characters/second of the word functions of unicodetricks
+    with category() (before) and with CLASS_TABLE (after).
+    NB splitPunc and cleanWords are covered by benchTokenizer.
+    '''
+    words = corpusText(corpus).split()
+    chars = sum(len(w) for w in words)
+    for new, old in ((plainLow, categoryPlainLow),
+                     (plainCaps, categoryPlainCaps),
+                     (stripAccents, categoryStripAccents)):
+        before, t_before = timed(lambda: [old(w) for w in words])
+        after, t_after = timed(lambda: [new(w) for w in words])
+        assert before == after, f'{new.__name__} differs from its predecessor'
+        report(new.__name__, chars / t_before, chars / t_after, 'chars')
+
+
+def benchTokenizerBackends(corpus=CORPUS, lengths=(50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000)):
+    '''Characters/second of splitPunc (python) and splitPuncArray (numpy)
+    for text nodes of increasing length; reports the crossover length
+    from which the numpy backend is faster.
+    '''
+    text = corpusText(corpus)
+    crossover = None
+    print(f'{"node length":<24}{"python":>22}{"numpy":>22}')
+    for length in lengths:
+        nodes = [text[i:i + length] for i in range(0, len(text) - length + 1, length)][:max(1, 200000 // length)]
+        chars = len(nodes) * length
+        before, t_before = timed(lambda: [splitPunc(n, norm='NFD', non_splitters=('-', '<')) for n in nodes])
+        after, t_after = timed(lambda: [splitPuncArray(n, norm='NFD', non_splitters=('-', '<')) for n in nodes])
+        assert before == after, 'splitPuncArray differs from splitPunc'
+        report(str(length), chars / t_before, chars / t_after, 'chars')
+        if crossover is None and t_after < t_before:
+            crossover = length
+    print(f'{"":<24}numpy backend is faster from {crossover} characters on')
+
+
+def benchReplaceCache(corpus=CORPUS, maxsize=100000):
+    '''Tokens/second of Greek.replace (before) and of
+    Greek.replaceCached (after) on the tokens of the corpus;
+    also reports the statistics of the cache.
+    '''
+    tokens = [t for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])]
+    before, t_before = timed(lambda: [tuple(Greek.replace(t)) for t in tokens], repeat=1)
+    cache = Greek.replace_cache
+    Greek.replace_cache = LRUCache(maxsize=maxsize)
+    try:
+        after, t_after = timed(lambda: [Greek.replaceCached(t) for t in tokens], repeat=1)
+        assert before == after, 'replaceCached differs from replace'
+        report('replace', len(tokens) / t_before, len(tokens) / t_after, 'tokens')
+        print(f'{"":<24}{Greek.replace_cache.summary()}')
+    finally:
+        Greek.replace_cache = cache
+
+
+def benchBetacode(corpus=CORPUS):
+    '''Tokens/second of Greek.replace with the betacode Replacer (before)
+    and with the Replacer skipped for Unicode input (after).
+    '''
+    tokens = [t for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])]
+    tokens = [t for t in tokens if not Greek.hasBetacode(t[1])]
+    before, t_before = timed(lambda: [tuple(Greek.replace(t)) for t in tokens], repeat=1)
+    after, t_after = timed(lambda: [tuple(Greek.replace(t, betacode=False)) for t in tokens], repeat=1)
+    assert before == after, 'skipping the Replacer changes the result'
+    report('betacode', len(tokens) / t_before, len(tokens) / t_after, 'tokens')
+
+
+def perWordNormWord(token):
+    '''Greek.normWord as it was before the shared Normaliser:
+    a Normaliser is created for every (comma-separated) word
+    '''
+    res = ','.join(set(
+        [normalize('NFD', Normaliser().normalise(w)[0]) for w in token[1].split(',')]))
+    return normalize('NFD', res)
+
+
+def benchNormWord(corpus=CORPUS, sample=1000000):
+    '''Tokens/second and microseconds/token of the norm text format
+    on a sample of 1M Greek tokens (the corpus repeated), with a
+    Normaliser per word (before) and with the shared Normaliser
+    and norm_cache (after).
+    '''
+    tokens = [t for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])]
+    tokens = [tuple(Greek.replace(t))[0] for t in tokens]
+    tokens = (tokens * (sample // len(tokens) + 1))[:sample]
+    before, t_before = timed(lambda: [perWordNormWord(t) for t in tokens], repeat=1)
+    cache = Greek.norm_cache
+    Greek.norm_cache = LRUCache(maxsize=100000)
+    try:
+        after, t_after = timed(lambda: [Greek.normWord(t) for t in tokens], repeat=1)
+        assert before == after, 'normWord differs from the per-word Normaliser'
+        report('normWord', len(tokens) / t_before, len(tokens) / t_after, 'tokens')
+        print(f'{"":<24}{t_before / len(tokens) * 1e6:.2f} µs/token before, '
+              f'{t_after / len(tokens) * 1e6:.2f} µs/token after')
+        print(f'{"":<24}{Greek.norm_cache.summary()}')
+    finally:
+        Greek.norm_cache = cache
+
+
+def corpusLemmatizer(corpus=CORPUS):
+    '''A lemma dictionary made of the word forms of the corpus
+    (and their plain forms), to be used by the lemmatizer benchmarks
+    '''
+    words = {Greek.replace(t)[0][1] for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])}
+    lemma_dict = {}
+    for w in words:
+        lemma_dict.setdefault(w, set()).add(plainLow(w))
+        lemma_dict.setdefault(plainLow(w), set()).add(w)
+    return lemma_dict
+
+
+def benchLemmaIndex(corpus=CORPUS):
+    '''Load time and lookups/second of a pickled lemma dictionary (before)
+    and of a LemmaIndex (after), for a lemma dictionary made of the
+    word forms of the corpus (and their plain forms).
+    '''
+    lemma_dict = corpusLemmatizer(corpus)
+    lookups = list(lemma_dict) * 5
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(path.join(tmp, 'lemmatizer.pickle'), 'wb') as f:
+            pickle.dump(lemma_dict, f, protocol=pickle.HIGHEST_PROTOCOL)
+        writeLemmaIndex(lemma_dict, path.join(tmp, 'lemmatizer.index'))
+
+        def loadPickle():
+            with open(path.join(tmp, 'lemmatizer.pickle'), 'rb') as f:
+                return pickle.load(f)
+        before, t_before = timed(loadPickle)
+        after, t_after = timed(LemmaIndex, path.join(tmp, 'lemmatizer.index'))
+        report('load', 1 / t_before, 1 / t_after, 'loads')
+        before, t_before = timed(lambda: [','.join(sorted(before[w])) for w in lookups])
+        index = after
+        after, t_after = timed(lambda: [','.join(index[w]) for w in lookups])
+        assert before == after, 'LemmaIndex differs from the lemma dictionary'
+        report('lookup', len(lookups) / t_before, len(lookups) / t_after, 'lookups')
+        index.close()
+
+
+def chainLemmatize(word, lemmatizer):
+    '''Greek.lemmatize as it was before lemmaLookup: the fallback
+    chain runs for every (comma-separated) word again
+    '''
+    word = normalize('NFD', word.lower())
+    result_set = set()
+    for w in word.split(','):
+        if w in lemmatizer:
+            lemma = ','.join(lemmatizer[w])
+        else:
+            w = Greek.jtNormalize(('', w, ''))
+            if w in lemmatizer:
+                lemma = ','.join(lemmatizer[w])
+            else:
+                w = Greek.plainWord(('', w, ''))
+                lemma = ','.join(lemmatizer[w]) if w in lemmatizer else f'*{w}'
+        result_set.update(normalize('NFD', lemma).split(','))
+    return ','.join(result_set)
+
+
+def benchLemmatize(corpus=CORPUS, node_len=100):
+    '''Tokens/second of lemmatizing every token (before) and of
+    lemmatizeMany per text node of node_len tokens (after), with a
+    LemmaIndex of two thirds of the word forms of the corpus.
+    '''
+    lemma_dict = corpusLemmatizer(corpus)
+    lemma_dict = {k: v for i, (k, v) in enumerate(lemma_dict.items()) if i % 3}
+    words = [Greek.replace(t)[0][1] for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])]
+    nodes = [words[i:i + node_len] for i in range(0, len(words), node_len)]
+    with tempfile.TemporaryDirectory() as tmp:
+        writeLemmaIndex(lemma_dict, path.join(tmp, 'lemmatizer.index'))
+        index = LemmaIndex(path.join(tmp, 'lemmatizer.index'))
+        before, t_before = timed(lambda: [chainLemmatize(w, index) for w in words], repeat=1)
+        Greek.lemma_cache.clear()
+        after, t_after = timed(lambda: [l for n in nodes for l in Greek.lemmatizeMany(n, index)], repeat=1)
+        assert [set(l.split(',')) for l in before] == [set(l.split(',')) for l in after], \
+            'lemmatizeMany differs from lemmatize'
+        report('lemmatize', len(words) / t_before, len(words) / t_after, 'tokens')
+        print(f'{"":<24}{Greek.lemma_cache.summary()}')
+        Greek.lemma_cache.clear()
+        Greek.lemma_cache_lemmatizer = None
+        index.close()
+
+
+def benchFuzzyLemma(corpus=CORPUS, max_distance=2):
+    '''Lookups/second and coverage of lemmaLookup without (before) and
+    with (after) the fuzzy fallback, for the word forms of the corpus
+    that are absent from a LemmaIndex of two thirds of them.
+    '''
+    lemma_dict = corpusLemmatizer(corpus)
+    lemma_dict = {k: v for i, (k, v) in enumerate(lemma_dict.items()) if i % 3}
+    words = sorted({Greek.replace(t)[0][1] for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])})
+    fuzzy_index, fuzzy_distance = Greek.FUZZY_INDEX, Greek.fuzzy_distance
+    with tempfile.TemporaryDirectory() as tmp:
+        writeLemmaIndex(lemma_dict, path.join(tmp, 'lemmatizer.index'))
+        index = LemmaIndex(path.join(tmp, 'lemmatizer.index'))
+        start = perf_counter()
+        writeFuzzyIndex(index, path.join(tmp, 'lemmatizer.fuzzy'), max_distance)
+        build = perf_counter() - start
+        Greek.FUZZY_INDEX, Greek.fuzzy_index = path.join(tmp, 'lemmatizer.fuzzy'), None
+        # The index is loaded once per process, which is not part of the lookups
+        _, load = timed(Greek.fuzzyIndex, repeat=1)
+        Greek.lemma_cache.clear()
+        misses = [w for w in words if Greek.lemmaLookup(w, index).startswith('*')]
+
+        def lookup(distance):
+            Greek.fuzzy_distance = distance
+            Greek.lemma_cache.clear()
+            return [Greek.lemmaLookup(w, index) for w in misses]
+        before, t_before = timed(lookup, 0)
+        after, t_after = timed(lookup, max_distance)
+        report('fuzzyLemma', len(misses) / t_before, len(misses) / t_after, 'lookups')
+        found = sum(1 for l in after if l.startswith('~'))
+        print(f'{"":<24}{len(misses):,} unknown forms of {len(words):,}; '
+              f'{found:,} ({found / len(misses):.1%}) found within {max_distance} edits; '
+              f'{t_after / len(misses) * 1e6:.0f} µs/lookup; index built in {build:.2f} s, loaded in {load:.2f} s')
+        Greek.fuzzy_index.close()
+        Greek.FUZZY_INDEX, Greek.fuzzy_index, Greek.fuzzy_distance = fuzzy_index, None, fuzzy_distance
+        Greek.lemma_cache.clear()
+        Greek.lemma_cache_lemmatizer = None
+        index.close()
+
+
+def benchSupplyAccents(corpus=CORPUS, sample=100000):
+    '''Tokens/second of accentuating every token (before) and of
+    supplyAccents with an empty (after) and with a saved accent_cache
+    (saved), for a manuscript-style version of the corpus: lowercase
+    and without any accents or breathings.
+    '''
+    words = [plainLow(Greek.replace(t)[0][1]) for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])]
+    words = words[:sample]
+    accent_cache = Greek.ACCENT_CACHE
+    before, t_before = timed(lambda: [Greek.accentuate(w) for w in words], repeat=1)
+
+    def supply():
+        Greek.accent_cache.clear()
+        return [Greek.supplyAccents(w) for w in words]
+    after, t_after = timed(supply)
+    assert before == after, 'supplyAccents differs from accentuate'
+    report('supplyAccents', len(words) / t_before, len(words) / t_after, 'tokens')
+    print(f'{"":<24}{Greek.accent_cache.summary()}')
+    with tempfile.TemporaryDirectory() as tmp:
+        Greek.ACCENT_CACHE = path.join(tmp, 'accentuations.pickle')
+        Greek.saveAccents()
+        start = perf_counter()
+        Greek.loadAccents()
+        load = perf_counter() - start
+        saved, t_saved = timed(lambda: [Greek.supplyAccents(w) for w in words])
+        assert saved == before, 'the saved accent_cache differs from accentuate'
+        report('supplyAccents (saved)', len(words) / t_before, len(words) / t_saved, 'tokens')
+        print(f'{"":<24}{len(Greek.accent_cache):,} accentuations loaded in {load:.2f} s')
+    Greek.ACCENT_CACHE = accent_cache
+    Greek.accent_cache.clear()
+
+
+def benchMorphology(corpus=CORPUS, node_len=100):
+    '''Tokens/second of morphWord per token (before) and of morphWords
+    per text node of node_len tokens (after), with a morphology index
+    of three quarters of the word forms of the corpus (and their plain
+    forms), each with one or two parse codes.
+    '''
+    codes = ('n-s---mn-', 'v3siia---', 'a-p---fa-', 'd--------', 'p-s---ng-', 'v1spia---')
+    rand = random.Random(0)
+    morph_dict = {k: set(rand.sample(codes, rand.randint(1, 2)))
+                  for i, k in enumerate(corpusLemmatizer(corpus)) if i % 4}
+    tokens = [Greek.replace(t)[0] for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])]
+    nodes = [tokens[i:i + node_len] for i in range(0, len(tokens), node_len)]
+    with tempfile.TemporaryDirectory() as tmp:
+        writeLemmaIndex(morph_dict, path.join(tmp, 'morphology.index'))
+        index = LemmaIndex(path.join(tmp, 'morphology.index'))
+        Greek.morph_cache.clear()
+        before, t_before = timed(lambda: [Greek.morphWord(t, index) for t in tokens], repeat=1)
+        Greek.morph_cache.clear()
+        after, t_after = timed(lambda: [p for n in nodes for p in Greek.morphWords(n, index)], repeat=1)
+        assert before == after, 'morphWords differs from morphWord'
+        report('morphology', len(tokens) / t_before, len(tokens) / t_after, 'tokens')
+        found = sum(1 for p in after if p)
+        print(f'{"":<24}{found / len(tokens):.1%} of the tokens parsed; {Greek.morph_cache.summary()}')
+        Greek.morph_cache.clear()
+        Greek.morph_cache_morphology = None
+        index.close()
+
+
+def loopFormats(conversion, token, token_processed):
+    '''The text formats of Conversion.process_text as they were before
+    the format plan: every format function is called separately, and
+    every result is normalized again
+    '''
+    for form, sett in conversion.text_formats.items():
+        if form in conversion.batch_formats:
+            token_processed[form] = None
+        elif form not in token_processed:
+            token_processed[form] = normalize(
+                conversion.udnorm, sett['function'](token, *conversion.format_args.get(form, ())))
+
+
+def benchFormatPlan(corpus=CORPUS, lang='greek'):
+    '''Tokens/second of the text formats after the replace function
+    as separate calls (before) and as a format plan (after)
+    '''
+    # NB tfbuilder needs the data of the conversion (data.tlge_metadata)
+    from tfbuilder import Conversion
+    conversion = Conversion(None, **{'supply_accents': False, **langsettings[lang]})
+    tokens = [Greek.replace(t)[0] for t in splitPunc(corpusText(corpus), norm='NFD') if plainLow(t[1])]
+    # The formats before the replace function have already been assigned
+    before_replace = {step[0]: '' for step in conversion.before_plan}
+
+    def loop():
+        output = []
+        for token in tokens:
+            token_processed = dict(before_replace)
+            loopFormats(conversion, token, token_processed)
+            output.append(token_processed)
+        return output
+
+    def plan():
+        output = []
+        for token in tokens:
+            token_processed = dict(before_replace)
+            conversion.runPlan(conversion.after_plan, token, token_processed)
+            output.append(token_processed)
+        return output
+    before, t_before = timed(loop)
+    after, t_after = timed(plan)
+    assert [list(d.items()) for d in before] == [list(d.items()) for d in after], \
+        'the format plan differs from the separate format functions'
+    report('formatPlan', len(tokens) / t_before, len(tokens) / t_after, 'tokens')
+
+
+def benchTokenCache(corpus=CORPUS, lang='greek', budget=256 * 2**20):
+    '''Tokens/second of Conversion.process_text for the text nodes
+    of the corpus without (before) and with a token cache of
+    budget bytes (after)
+    '''
+    # NB tfbuilder needs the data of the conversion (data.tlge_metadata)
+    import tfbuilder
+    texts = [content for file in corpus for code, content in dataParser(xmlSplitter(file)) if code == 'text']
+
+    def process(token_cache_bytes):
+        tfbuilder.tokenCache.clear()
+        tfbuilder.tokenCache.resize(sys.maxsize, token_cache_bytes)
+        conversion = tfbuilder.Conversion(None, **{**langsettings[lang], 'supply_accents': False,
+                                                   'token_cache_bytes': token_cache_bytes})
+        return conversion, [token_processed for text in texts for token_processed in conversion.process_text(text)]
+    (_, before), t_before = timed(process, 0)
+    (conversion, after), t_after = timed(process, budget)
+    assert before == after, 'the token cache changes the output'
+    report('tokenCache', len(before) / t_before, len(after) / t_after, 'tokens')
+    print(f'{"":<24}{conversion.tokenCacheSummary()}')
+    tfbuilder.tokenCache.clear()
+
+
+# The lemmatizer that is inherited by the workers of benchSharedLemmatizer
+workerLemmatizer = None
+
+
+def lookupAll():
+    '''Looks up all keys of workerLemmatizer and returns the growth
+    of the private memory (USS) of the worker in bytes
+    '''
+    keys = [normalize('NFD', key) for key in workerLemmatizer]
+    process = psutil.Process()
+    uss = process.memory_full_info().uss
+    for key in keys:
+        ','.join(workerLemmatizer[key])
+    return process.memory_full_info().uss - uss
+
+
+def benchSharedLemmatizer(corpus=CORPUS, workers=8):
+    '''Growth of the private memory of forked workers that look up all
+    keys of the lemmatizer, for a lemma dictionary (before) and for
+    the LemmaIndex made by shareLemmatizer (after).
+    '''
+    global workerLemmatizer
+    if psutil is None:
+        print(f'{"sharedLemmatizer":<24}skipped (psutil is not installed)')
+        return
+    lemma_dict = corpusLemmatizer(corpus)
+    growth = []
+    for lemmatizer in (lemma_dict, shareLemmatizer(lemma_dict)):
+        workerLemmatizer = lemmatizer
+        with get_context('fork').Pool(workers) as pool:
+            growth.append(sum(pool.starmap(lookupAll, [()] * workers)))
+    workerLemmatizer.close()
+    workerLemmatizer = None
+    print(f'{"sharedLemmatizer":<24}{len(lemma_dict)} keys, {workers} workers: '
+          f'{growth[0] / 2**20:.1f} MB (dict) vs {growth[1] / 2**20:.1f} MB (LemmaIndex) of private memory')
+
+
+def benchSchedule(files=2000, workers=16, seed=0):
+    '''Makespan of a simulated conversion of files of which the sizes
+    follow a heavy-tailed (log-normal) distribution, with the files
+    in filesystem (random) order (before) and in LPT order (after),
+    both by size only and by the exact timings of an earlier run
+    '''
+    rng = random.Random(seed)
+    sizes = [rng.lognormvariate(12, 1.5) for _ in range(files)]
+    # The seconds per byte vary per file (e.g. with the share of betacode)
+    costs = [size * rng.uniform(0.7, 1.3) / 1e5 for size in sizes]
+    ideal = idealMakespan(costs, workers)
+    by_size = [cost for size, cost in sorted(zip(sizes, costs), reverse=True)]
+    for name, order in (('filesystem', costs), ('LPT by size', by_size), ('LPT by timings', sorted(costs, reverse=True))):
+        makespan = simulateMakespan(order, workers)
+        print(f'{"schedule":<24}{name:<16}{makespan:>10.1f} s (ideal {ideal:.1f} s, {ideal / makespan:.1%})')
+
+
+BENCHMARKS = {
+    'dataParser': benchDataParser,
+    'attribClean': benchAttribClean,
+    'tokenizer': benchTokenizer,
+    'charClasses': benchCharClasses,
+    'tokenizerBackends': benchTokenizerBackends,
+    'replaceCache': benchReplaceCache,
+    'betacode': benchBetacode,
+    'normWord': benchNormWord,
+    'lemmaIndex': benchLemmaIndex,
+    'sharedLemmatizer': benchSharedLemmatizer,
+    'lemmatize': benchLemmatize,
+    'fuzzyLemma': benchFuzzyLemma,
+    'supplyAccents': benchSupplyAccents,
+    'morphology': benchMorphology,
+    'formatPlan': benchFormatPlan,
+    'tokenCache': benchTokenCache,
+    'schedule': benchSchedule,
+}
+
+
+if __name__ == '__main__':
+    print(f'{"benchmark":<24}{"before":>22}{"after":>22}{"speedup":>9}')
+    for name in (sys.argv[1:] or BENCHMARKS):
+        BENCHMARKS[name]()
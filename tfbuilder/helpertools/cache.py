@@ -0,0 +1,133 @@
+# Cache.py contains the bounded caches that are used
+# to avoid repeating the same work for recurring input,
+# like XML tag templates or Greek word forms.
+
+import pickle
+from os import path, replace
+from collections import OrderedDict
+
+
+class LRUCache:
+    '''LRUCache is a cache of at most maxsize items; if it is full,
+    the least recently used item is evicted. It keeps track of
+    the number of hits, misses and evictions.
+
+    NB get() returns a tuple (found, value), so that None
+    can be cached as a value as well.
+
+    A cache can be kept across runs with save() and load().
+
+    If a function sizeof(key, value) is given, that estimates the
+    memory used by an item in bytes, the cache is also kept within
+    a budget of maxbytes bytes (if maxbytes is given).
+    '''
+    def __init__(self, maxsize=4096, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self.data = OrderedDict()
+        self.changed = False    # Items have been added (see save())
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.data), 'maxsize': self.maxsize,
+                'bytes': self.bytes, 'maxbytes': self.maxbytes}
+
+    def stats(self):
+        return (self.hits, self.misses, self.evictions)
+
+    def summary(self):
+        if self.maxbytes:
+            used = f'{len(self.data)} entries, {self.bytes / 2**20:.1f} of {self.maxbytes / 2**20:.1f} MB'
+        else:
+            used = f'{len(self.data)} of {self.maxsize} entries'
+        return statsSummary(self.hits, self.misses, self.evictions, used)
+
+    def clear(self):
+        self.data.clear()
+        self.changed = False
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def resize(self, maxsize, maxbytes=None):
+        self.maxsize = maxsize
+        if maxbytes is not None:
+            self.maxbytes = maxbytes
+        self.evict()
+
+    def evict(self):
+        '''Evicts the least recently used items, until the
+        cache is within maxsize items (and maxbytes bytes)
+        '''
+        while len(self.data) > self.maxsize or \
+                (self.maxbytes is not None and self.bytes > self.maxbytes and self.data):
+            key, value = self.data.popitem(last=False)
+            if self.sizeof:
+                self.bytes -= self.sizeof(key, value)
+            self.evictions += 1
+
+    def get(self, key):
+        value = self.data.get(key, self)
+        if value is self:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self.data.move_to_end(key)
+        return True, value
+
+    def put(self, key, value):
+        self.changed = True
+        if self.sizeof:
+            if key in self.data:
+                self.bytes -= self.sizeof(key, self.data[key])
+            self.bytes += self.sizeof(key, value)
+            self.data[key] = value
+            self.evict()
+        else:
+            self.data[key] = value
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def save(self, filepath):
+        '''Saves the items of the cache (from least to most
+        recently used) to filepath, if any have been added
+        since the cache has been cleared or loaded
+        '''
+        if not self.changed:
+            return
+        with open(f'{filepath}.tmp', 'wb') as f:
+            pickle.dump(list(self.data.items()), f, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(f'{filepath}.tmp', filepath)
+
+    def load(self, filepath):
+        '''Loads the items saved by save() (if filepath exists),
+        as far as they fit in the cache; the counters are reset
+        '''
+        self.clear()
+        if path.isfile(filepath):
+            with open(filepath, 'rb') as f:
+                items = pickle.load(f)
+            self.data.update(items[-self.maxsize:] if self.maxsize else [])
+            if self.sizeof:
+                self.bytes = sum(self.sizeof(key, value) for key, value in self.data.items())
+                self.evict()
+
+
+def statsSummary(hits, misses, evictions, used=None):
+    '''Returns a summary of the statistics of a cache (see LRUCache.stats()),
+    e.g. of the sum of the statistics of the caches of several workers
+    '''
+    lookups = hits + misses
+    ratio = f'{round(hits / (lookups / 100), 2)}%' if lookups else '-'
+    return f'{hits} hits, {misses} misses, {evictions} evictions ' \
+           f'(hit rate {ratio}{", " + used if used else ""})'
@@ -0,0 +1,153 @@
+# Journal.py contains the run journal of a conversion: an
+# append-only file in the output root, with a line of JSON
+# per file that is started or finished, that records the input,
+# the hashes of its content and of the settings, the output
+# path and the status. It allows an interrupted conversion to
+# be resumed (see convert(resume=True) in tfbuilder), and
+# the files that have not changed since their last conversion
+# to be skipped (see convert(incremental=True)).
+
+import os
+import sys
+import json
+import hashlib
+from os import path
+from time import strftime
+from collections.abc import Mapping
+
+JOURNAL = 'journal.jsonl'
+
+# Settings that do not change the output of a conversion, so that
+# they are left out of the hash of the settings (see configHash()):
+# the sizes of caches
+NEUTRAL_SETTINGS = ('token_cache_bytes',)
+
+# Settings that are loaded indexes; they are represented by a hash
+# of their index files or of their content (see indexFingerprint())
+INDEX_SETTINGS = ('lemmatizer', 'morphology')
+
+# The statuses of a file that need no retry if a conversion is resumed
+COMPLETED = ('converted', 'skipped')
+
+
+def fileHash(filepath, chunk_size=2**20):
+    '''Returns the SHA-256 hash of the content of a file'''
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# The hashes of the source files of modules, per run (see moduleHash())
+module_hashes = {}
+
+
+def moduleHash(module):
+    '''Returns the hash of the source file of a module, so that a
+    function is represented by its code as well as by its name
+    '''
+    if module not in module_hashes:
+        filepath = getattr(sys.modules.get(module), '__file__', None)
+        module_hashes[module] = fileHash(filepath)[:16] if filepath and path.isfile(filepath) else ''
+    return module_hashes[module]
+
+
+def indexFingerprint(index):
+    '''Returns a fingerprint of a lemmatizer or morphology: the hash of
+    its index file, if it has one (like a LemmaIndex), or the hash of
+    its content, if it is a mapping (like a lemma dictionary);
+    otherwise its type
+    '''
+    indexpath = getattr(index, 'indexpath', None)
+    if indexpath and path.isfile(indexpath):
+        return fileHash(indexpath)
+    if isinstance(index, Mapping):
+        digest = hashlib.sha256()
+        for item in sorted(stableRepr(item) for item in index.items()):
+            digest.update(item.encode())
+            digest.update(b'\n')
+        return digest.hexdigest()
+    return type(index).__qualname__
+
+
+def stableRepr(value):
+    '''Returns a representation of a setting that is the same in every
+    run: mappings and sets are sorted, and functions and classes are
+    represented by their qualified names and the hash of the source of
+    their module, instead of by their addresses
+    '''
+    if isinstance(value, Mapping):
+        return '{' + ', '.join(sorted(f'{stableRepr(k)}: {stableRepr(v)}' for k, v in value.items())) + '}'
+    if isinstance(value, (set, frozenset)):
+        return '{' + ', '.join(sorted(stableRepr(v) for v in value)) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(stableRepr(v) for v in value) + ']'
+    if value is None or isinstance(value, (str, bytes, int, float, bool)):
+        return repr(value)
+    if hasattr(value, '__self__') and hasattr(value, '__name__'):
+        # A bound method, e.g. a classmethod of a langtool
+        owner = value.__self__ if isinstance(value.__self__, type) else type(value.__self__)
+        return f'{owner.__module__}.{owner.__qualname__}.{value.__name__}@{moduleHash(owner.__module__)}'
+    if hasattr(value, '__qualname__'):
+        return f'{value.__module__}.{value.__qualname__}@{moduleHash(value.__module__)}'
+    return type(value).__qualname__
+
+
+def configHash(settings, options):
+    '''Returns the SHA-256 hash of the settings of a conversion
+    (except NEUTRAL_SETTINGS and the cache sizes) and of its options
+    '''
+    settings = {setting: indexFingerprint(value) if setting in INDEX_SETTINGS else value
+                for setting, value in settings.items()
+                if setting not in NEUTRAL_SETTINGS and not setting.endswith('_cache_size')}
+    return hashlib.sha256(stableRepr({'settings': settings, 'options': options}).encode()).hexdigest()
+
+
+def appendJournal(journalpath, **entry):
+    '''Appends an entry to the journal; every entry is written in
+    a single write to a file opened for appending, so that the
+    entries of concurrent workers do not get mixed up
+    '''
+    line = json.dumps({**entry, 'time': strftime('%Y-%m-%dT%H:%M:%S')}, ensure_ascii=False) + '\n'
+    fd = os.open(journalpath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+def readJournal(journalpath):
+    '''Returns the entries of the journal in the order in which they
+    have been written; a last line that has been cut off is ignored
+    '''
+    if not path.isfile(journalpath):
+        return []
+    entries = []
+    with open(journalpath, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return entries
+
+
+def lastEntries(entries):
+    '''Returns the last entry of every file: {file: entry}'''
+    return {entry['file']: entry for entry in entries}
+
+
+def upToDate(entry, content_hash, config_hash):
+    '''Returns True if the last entry of a file shows that it has been
+    completed with the same content and settings, and that its output
+    (if any) still exists
+    '''
+    return entry is not None and entry['status'] in COMPLETED and \
+        entry['content_hash'] == content_hash and entry['config_hash'] == config_hash and \
+        (not entry.get('output') or path.isdir(entry['output']))
+
+
+def lastOutputs(entries):
+    '''Returns the last output path of every file: {file: output}'''
+    return {entry['file']: entry['output'] for entry in entries if entry.get('output')}
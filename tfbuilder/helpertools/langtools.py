@@ -3,13 +3,16 @@
 # Any information that is specific for the TEI XML
 # conversion, can be found in tf_config.py
 
-import pickle
+import re
 import betacode.conv
+from os import path
 from unicodedata import normalize
 
 # Local imports
 from data import attrib_errors
-from helpertools.unicodetricks import splitPunc, cleanWords, plainCaps, plainLow
+from helpertools.unicodetricks import splitPunc, splitPuncArray, cleanWords, plainCaps, plainLow, NUMPY_MIN_LEN
+from helpertools.cache import LRUCache
+from helpertools.lemmatizer import LemmaIndex, FuzzyIndex, pickleToIndex
 from helpertools.data.greek import MOVEABLE_NU_ENDINGS, MOVEABLE_NU, ELISION, CRASIS, NOMINASACRA, BIBLICAL_BOOKS
 
 # Functions and classes specific for Greek
@@ -24,10 +27,22 @@ beta_to_uni = Replacer()
 
 class Generic:
     udnorm = 'NFD'
+    # Names of the LRUCache attributes of the langtool; their sizes can be
+    # set in tf_config.py by '<name>_size' (e.g. 'replace_cache_size')
+    caches = ()
+    # Text format functions of which the results are already in a
+    # Unicode norm (None: the udnorm of the langtool), so that they
+    # need not be normalized again (see Conversion.formatPlan())
+    normalized_formats = {'origWord': None, 'mainWord': None, 'plainWord': 'NFD'}
+    # Text format functions that only transform the result of another one:
+    # {function: (source function, transformation)}, so that the source
+    # is computed once for all formats (see Conversion.formatPlan())
+    derived_formats = {}
 
     @classmethod
-    def replace(cls, token):
-        """NB the replace method should always return a list or tuple in the original token format"""
+    def replace(cls, token, **kwargs):
+        """NB the replace method should always return a list or tuple in the original token format;
+        options that a langtool does not support (like supply_accents) are ignored"""
         return (token,)
 
     @classmethod
@@ -67,14 +82,25 @@ class Generic:
 
     @classmethod
     def splitTokenize(cls, sentence, punc=True, clean=False,
-                      splitters=None, non_splitters=('-',)):
+                      splitters=None, non_splitters=('-',), backend='python'):
         """Tokenizes a sentence, while preserving punctuation.
 
         The difference with tokenize() is that splitTokenize
         preserves splits punctuation from the word.
 
+        backend='python':
+            splitPunc tokenizes the sentence character by character.
+        backend='numpy':
+            splitPuncArray tokenizes the sentence with NumPy arrays.
+        backend='auto':
+            splitPuncArray is used for sentences of NUMPY_MIN_LEN
+            characters or longer, splitPunc for shorter ones.
+
         returns: ((pre, word, post), (pre, word, post), ...)
         """
+        if backend == 'numpy' or (backend == 'auto' and len(sentence) >= NUMPY_MIN_LEN):
+            return splitPuncArray(sentence, norm=cls.udnorm, clean=clean,
+                                  splitters=splitters, non_splitters=non_splitters)
         return splitPunc(sentence, norm=cls.udnorm, clean=clean,
                          splitters=splitters, non_splitters=non_splitters)
 
@@ -141,6 +167,9 @@ class Greek(Generic):
     # NB all functions in Greek work internally with the NFD norm, 
     # however, when called, it is converted to the configured Unicode norm
     udnorm = 'NFD'
+    normalized_formats = {**Generic.normalized_formats,
+                          'normWord': None, 'cleanPlain': 'NFD', 'reducePlain': 'NFD'}
+    derived_formats = {'cleanPlain': ('plainWord', 'reducePlain')}
     
     # Define elision abbreviation signs
     ELISION_signs = {'᾿', '᾽', "'", 'ʼ', 'ʹ', '’'}
@@ -165,16 +194,86 @@ class Greek(Generic):
             ELISION_plain[key].add(v)
     # The value sets make sure that only unique forms are saved; however, they need to be converted to string
     ELISION_plain = {k: ','.join(v) for k, v in ELISION_plain.items()}
-    
+
+    # Characters the betacode Replacer acts on (after text.upper());
+    # every pattern of the Replacer that changes a string contains
+    # at least one of them, so that a string without these characters
+    # is only case-folded by the Replacer
+    betacodeRE = re.compile(r"[A-Z*:'_]")
 
     @classmethod
-    def replace(cls, token, **kwargs):
+    def hasBetacode(cls, text):
+        """Checks whether text might contain betacode, that is
+        whether the betacode Replacer would change more than
+        the case of the text.
+
+        returns True or False
+        """
+        return cls.betacodeRE.search(text.upper()) is not None
+
+    @classmethod
+    def betaCode(cls, text, betacode=True):
+        """Converts betacode to Unicode with the Replacer, unless
+        betacode=False, in which case the text is known to contain
+        no betacode (see hasBetacode()) and the regex machinery of
+        the Replacer is skipped. The result is the same.
+        """
+        if betacode:
+            return beta_to_uni.beta_code(text)
+        return text.upper().replace('-', '')
+
+    caches = ('replace_cache', 'norm_cache', 'lemma_cache', 'accent_cache', 'morph_cache')
+
+    # Cache of the results of replace() per token (pre, word, post);
+    # its size is set by 'replace_cache_size' in tf_config.py
+    replace_cache = LRUCache(maxsize=100000)
+    # Cache of the results of normWord() per word
+    norm_cache = LRUCache(maxsize=100000)
+    # Cache of the results of lemmaLookup() per word; it belongs
+    # to one lemmatizer (lemma_cache_lemmatizer)
+    lemma_cache = LRUCache(maxsize=200000)
+    lemma_cache_lemmatizer = None
+    # Cache of the results of accentuate() per unaccented word; it is
+    # kept across runs in ACCENT_CACHE (see loadAccents() and saveAccents())
+    accent_cache = LRUCache(maxsize=200000)
+    ACCENT_CACHE = 'data/accentuations.pickle'
+    accents_loaded = False
+    # The accentuations computed since the last takeAccents(), so that
+    # a worker can hand them to the parent (see mergeAccents())
+    new_accents = {}
+    # Cache of the results of morphology() per word; it belongs
+    # to one morphology index (morph_cache_morphology)
+    morph_cache = LRUCache(maxsize=200000)
+    morph_cache_morphology = None
+    # The Normaliser of James Tauber, created on first use (see normaliser())
+    _normaliser = None
+
+    @classmethod
+    def replaceCached(cls, token, **kwargs):
+        """Returns the result of replace() for the token, but looks
+        it up in replace_cache first. Since the result of replace()
+        depends on the token only, recurring word forms (with the
+        same surrounding punctuation) are replaced only once.
+
+        returns ((pre, word, post), ...)
+        """
+        # With supply_accents the result differs, so it gets another key
+        key = (token, 'supply_accents') if kwargs.get('supply_accents') else token
+        found, result = cls.replace_cache.get(key)
+        if not found:
+            result = tuple(cls.replace(token, **kwargs))
+            cls.replace_cache.put(key, result)
+        return result
+
+    @classmethod
+    def replace(cls, token, betacode=True, supply_accents=False, **kwargs):
         pre, word, post = token
         # Convert to Unicode anyway, because sometimes there is Latin characters in Greek words
+        # (unless betacode=False, because the text node is known to contain no betacode)
         # We also bring the Unicode type into concord with the norm: 'NFD'
         # and we replace abbreviation signs with the appropriate one.
         word = ''.join([c if not c in cls.ELISION_signs else cls.ELISION_replacement \
-                        for c in normalize(cls.udnorm, beta_to_uni.beta_code(word).lower())])
+                        for c in normalize(cls.udnorm, cls.betaCode(word, betacode).lower())])
         
         # Make a plain version while keeping the ELISION replacement
         plain_word = ''.join([plainLow(c) if not c == cls.ELISION_replacement else cls.ELISION_replacement for c in word])
@@ -294,19 +393,8 @@ class Greek(Generic):
                 w = NOMINASACRA[w]
             # The next fase is that of accentuating unaccentuated words
             # NB any possible ','-separated value is anyway accentuated
-            word_set = set()
-#             if w == plainLow(w):
-#                 if kwargs['supply_accents']:
-#                     # Try to syllabify the word, but if it gives errors: just pass it...
-#                     try:
-#                         s = syllabify(w)
-#                         for accentuation in possible_accentuations(s):
-#                             word_set.add(add_accent(s, accentuation))
-#                         for accentuation in possible_accentuations(s, default_short=True):
-#                             word_set.add(add_accent(s, accentuation))
-#                         w = ','.join(word_set)
-#                     except:
-#                         pass
+            if supply_accents and w == plainLow(w):
+                w = cls.supplyAccents(w)
 
             # Put the results in the result list
             if len(word_list) > 1:
@@ -322,6 +410,75 @@ class Greek(Generic):
 
         return tuple(result)
 
+    @classmethod
+    def accentuate(cls, word):
+        """Returns all possible accentuations of an unaccented word,
+        both with long and with short ambiguous vowels, e.g.
+        'χριστου' -> 'χρίστου,χριστού,χριστοῦ'.
+        If the word cannot be syllabified, it is returned as it is.
+
+        returns 'word,word,...'
+        """
+        # Try to syllabify the word, but if it gives errors: just pass it...
+        try:
+            s = syllabify(word)
+            word_set = {add_accent(s, accentuation) for accentuation in possible_accentuations(s)}
+            word_set.update(add_accent(s, accentuation)
+                            for accentuation in possible_accentuations(s, default_short=True))
+        except Exception:
+            return word
+        if not word_set:
+            return word
+        return normalize(cls.udnorm, ','.join(sorted(word_set)))
+
+    @classmethod
+    def supplyAccents(cls, word):
+        """Returns accentuate(word), but looks it up in accent_cache
+        first: accentuate() is slow, but the number of distinct
+        unaccented word forms is limited.
+        """
+        found, accented = cls.accent_cache.get(word)
+        if not found:
+            accented = cls.accentuate(word)
+            cls.accent_cache.put(word, accented)
+            cls.new_accents[word] = accented
+        return accented
+
+    @classmethod
+    def loadAccents(cls):
+        """Loads the accentuations of earlier runs into accent_cache,
+        once per process (a forked worker has them already)
+        """
+        if not cls.accents_loaded:
+            cls.accent_cache.load(cls.ACCENT_CACHE)
+            cls.accents_loaded = True
+
+    @classmethod
+    def takeAccents(cls):
+        """Returns the accentuations computed since the last call"""
+        accents, cls.new_accents = cls.new_accents, {}
+        return accents
+
+    @classmethod
+    def mergeAccents(cls, accents):
+        """Adds accentuations computed by a worker to accent_cache"""
+        for word, accented in accents.items():
+            cls.accent_cache.put(word, accented)
+
+    @classmethod
+    def saveAccents(cls):
+        """Saves accent_cache for later runs"""
+        cls.accent_cache.save(cls.ACCENT_CACHE)
+
+    @classmethod
+    def normaliser(cls):
+        """Returns the Normaliser of James Tauber; it is created
+        once per process, on first use.
+        """
+        if cls._normaliser is None:
+            cls._normaliser = Normaliser()
+        return cls._normaliser
+
     @classmethod
     def jtNormalize(cls, token, comma=True):
         """This method returns a normalized word
@@ -329,62 +486,125 @@ class Greek(Generic):
         of James Tauber; formatted in the NFD format.
         """
         pre, word, post = token
+        normaliser = cls.normaliser()
         if comma:
             res = ','.join(set(
-                [normalize(cls.udnorm, Normaliser().normalise(w)[0]) for w in word.split(',')]))
+                [normalize(cls.udnorm, normaliser.normalise(w)[0]) for w in word.split(',')]))
         else:
-            res = normalize(cls.udnorm, Normaliser().normalise(word)[0])
+            res = normalize(cls.udnorm, normaliser.normalise(word)[0])
         return res
 
-    @staticmethod
-    def startLemmatizer():
-        """The lemmatizer contains NFD formatted data only
+    # The lemmatizer is a binary index (see helpertools/lemmatizer.py);
+    # a pickled lemmatizer is converted to an index on first use
+    LEMMA_INDEX = 'data/lemmatizer.index'
+    LEMMA_PICKLE = 'data/lemmatizer.pickle'
+
+    @classmethod
+    def startLemmatizer(cls):
+        """The lemmatizer contains NFD formatted data only;
+        it is memory-mapped, so that it loads instantly
         """
 #         lemmatizer = {0:0} # dummy
         print('    |  loading lemmatizer...')
         print('    |  ...')
-        lemmatizer_open = open('data/lemmatizer.pickle', 'rb')
-        lemmatizer = pickle.load(lemmatizer_open)
-        lemmatizer_open.close()
-        return lemmatizer
+        if not path.isfile(cls.LEMMA_INDEX) and path.isfile(cls.LEMMA_PICKLE):
+            pickleToIndex(cls.LEMMA_PICKLE, cls.LEMMA_INDEX)
+        return LemmaIndex(cls.LEMMA_INDEX)
+
 
+    # The fuzzy fallback of lemmaLookup() is used if fuzzy_distance > 0
+    # (see 'fuzzy_distance' in tf_config.py) and the fuzzy index has been
+    # built next to the lemmatizer; the index is opened on first use
+    FUZZY_INDEX = 'data/lemmatizer.fuzzy'
+    fuzzy_distance = 0
+    fuzzy_index = None
 
     @classmethod
-    def lemmatize(cls, word, lemmatizer, comma=True):
-        word = normalize('NFD', word.lower())
+    def fuzzyIndex(cls):
+        """Returns the FuzzyIndex, or False if it does not exist"""
+        if cls.fuzzy_index is None:
+            cls.fuzzy_index = FuzzyIndex(cls.FUZZY_INDEX) if path.isfile(cls.FUZZY_INDEX) else False
+        return cls.fuzzy_index
 
-        def worker(word):
+    @classmethod
+    def fuzzyLemma(cls, word, lemmatizer):
+        """Returns the lemmata of the known plain forms that are nearest
+        to the plain word, within fuzzy_distance edits; every lemma is
+        marked with '~', e.g. '~λόγος,~λέγω'.
+
+        returns 'lemma,lemma,...' or None if no lemma has been found
+        """
+        if not cls.fuzzy_distance or ',' in word or not cls.fuzzyIndex():
+            return None
+        distance, forms = cls.fuzzy_index.nearest(word, cls.fuzzy_distance)
+        lemmata = sorted({lemma for form in forms for lemma in lemmatizer.get(form, ())})
+        if not lemmata:
+            return None
+        return normalize(cls.udnorm, ','.join(f'~{lemma}' for lemma in lemmata))
+
+    @classmethod
+    def lemmaLookup(cls, word, lemmatizer):
+        """Looks up the lemmata of a single word in the lemmatizer;
+        if the word is absent, its normalized form (see normWord()),
+        and after that its plain form is tried; finally, if enabled,
+        the lemmata of the nearest plain forms (see fuzzyLemma()).
+        The results (both hits and misses) are kept in lemma_cache.
+
+        returns 'lemma,lemma,...' or '*word' if no lemma has been found
+        """
+        if lemmatizer is not cls.lemma_cache_lemmatizer:
+            cls.lemma_cache.clear()
+            cls.lemma_cache_lemmatizer = lemmatizer
+        found, lemma = cls.lemma_cache.get(word)
+        if found:
+            return lemma
+        key = word
+        if word in lemmatizer:
+            lemma = normalize(cls.udnorm, ','.join(lemmatizer[word]))
+        else:
+            word = cls.normWord(word, split=False)
             if word in lemmatizer:
                 lemma = normalize(cls.udnorm, ','.join(lemmatizer[word]))
             else:
-                word = cls.jtNormalize(('', word, ''))
+                word = cls.plainWord(('', word, ''))
                 if word in lemmatizer:
-                    lemma = normalize(cls.udnorm, ','.join(lemmatizer[word]))
+                    lemma = normalize(
+                        cls.udnorm, ','.join(lemmatizer[word]))
                 else:
-                    word = cls.plainWord(('', word, ''))
-                    if word in lemmatizer:
-                        lemma = normalize(
-                            cls.udnorm, ','.join(lemmatizer[word]))
-                    else:
-                        lemma = f'*{normalize(cls.udnorm, word)}'
-            return lemma
+                    lemma = cls.fuzzyLemma(word, lemmatizer) or f'*{normalize(cls.udnorm, word)}'
+        cls.lemma_cache.put(key, lemma)
+        return lemma
 
+    @classmethod
+    def lemmatize(cls, word, lemmatizer, comma=True):
+        word = normalize('NFD', word.lower())
         if comma:
             word_list = word.split(',')
             result_set = set()
             for w in word_list:
-                result_set.update(worker(w).split(','))
+                result_set.update(cls.lemmaLookup(w, lemmatizer).split(','))
             res = ','.join(result_set)
         else:
-            res = worker(word)
+            res = cls.lemmaLookup(word, lemmatizer)
         return res
 
+    @classmethod
+    def lemmatizeMany(cls, words, lemmatizer, comma=True):
+        """Lemmatizes a sequence of words (see lemmatize());
+        every distinct word is lemmatized only once.
+
+        returns ['lemma,lemma,...', ...] in the order of words
+        """
+        lemmata = {word: None for word in words}
+        for word in lemmata:
+            lemmata[word] = cls.lemmatize(word, lemmatizer, comma=comma)
+        return [lemmata[word] for word in words]
 
     @classmethod
     def beta2uni(cls, word):
         """Converts betacode to unicode"""
 #         beta_to_uni = Replacer()
-        return normalize(cls.udnorm, beta_to_uni.beta_code(word))
+        return normalize(cls.udnorm, cls.betaCode(word, cls.hasBetacode(word)))
 
     # @classmethod
     # def uni2betaPlain(cls, word):
@@ -395,17 +615,71 @@ class Greek(Generic):
     #     word_plain = plainLow(word)
     #     return betacode.conv.uni_to_beta(word_plain)
 
-    @staticmethod
-    def morphology(plain_betacode_word):
-        pass
+    # The morphology is a binary index like the lemmatizer
+    # (see helpertools/morphology.py)
+    MORPH_INDEX = 'data/morphology.index'
+
+    @classmethod
+    def startMorphology(cls):
+        """The morphology contains NFD formatted data only;
+        it is memory-mapped, like the lemmatizer
+        """
+        print('    |  loading morphology...')
+        return LemmaIndex(cls.MORPH_INDEX)
+
+    @classmethod
+    def morphology(cls, word, morphology):
+        """Looks up the parse codes of a single word in the morphology
+        index; if the word is absent, its normalized form (see normWord())
+        and after that its plain form is tried, like lemmaLookup().
+        The results are kept in morph_cache.
+
+        returns 'code,code,...' or '' if no parse code has been found
+        """
+        if morphology is not cls.morph_cache_morphology:
+            cls.morph_cache.clear()
+            cls.morph_cache_morphology = morphology
+        found, codes = cls.morph_cache.get(word)
+        if found:
+            return codes
+        codes = morphology.get(word)
+        if codes is None:
+            codes = morphology.get(cls.normWord(word, split=False))
+        if codes is None:
+            codes = morphology.get(cls.plainWord(('', word, '')), ())
+        codes = ','.join(codes)
+        cls.morph_cache.put(word, codes)
+        return codes
+
+    @classmethod
+    def parseWords(cls, words, morphology):
+        """Looks up the parse codes of a sequence of words (see morphology());
+        every distinct word is looked up only once, and ','-separated
+        alternatives of a word are combined.
+
+        returns ['code,code,...', ...] in the order of words
+        """
+        parses = {word: None for word in words}
+        for word in parses:
+            codes = set()
+            for w in normalize(cls.udnorm, word.lower()).split(','):
+                codes.update(cls.morphology(w, morphology).split(','))
+            codes.discard('')
+            parses[word] = ','.join(sorted(codes))
+        return [parses[word] for word in words]
 
     # ADDITIONAL TEXT OUTPUT FORMATS
     @classmethod
     def normWord(cls, token, split=True):
-        if split:
-            return normalize(cls.udnorm, cls.jtNormalize(token))
-        else:
-            return normalize(cls.udnorm, cls.jtNormalize(('', token, '')))
+        """Returns the normalized word (see jtNormalize());
+        the results are kept in norm_cache.
+        """
+        word = token[1] if split else token
+        found, res = cls.norm_cache.get(word)
+        if not found:
+            res = normalize(cls.udnorm, cls.jtNormalize(('', word, '')))
+            cls.norm_cache.put(word, res)
+        return res
 
     @classmethod
     def betaPlainWord(cls, token, split=True):
@@ -426,13 +700,45 @@ class Greek(Generic):
         else:
             return cls.lemmatize(token, lemmatizer)
 
+    @classmethod
+    def lemmaWords(cls, tokens, lemmatizer, split=True):
+        """Batch version of lemmaWord() for all tokens of a text"""
+        if split:
+            return cls.lemmatizeMany([word for pre, word, post in tokens], lemmatizer)
+        else:
+            return cls.lemmatizeMany(tokens, lemmatizer)
+
+    @classmethod
+    def morphWord(cls, token, morphology, split=True):
+        if split:
+            pre, word, post = token
+            return cls.parseWords((word,), morphology)[0]
+        else:
+            return cls.parseWords((token,), morphology)[0]
+
+    @classmethod
+    def morphWords(cls, tokens, morphology, split=True):
+        """Batch version of morphWord() for all tokens of a text"""
+        if split:
+            return cls.parseWords([word for pre, word, post in tokens], morphology)
+        else:
+            return cls.parseWords(tokens, morphology)
+
+    # The letters that are left out by cleanPlain()
+    REDUCED_table = str.maketrans('', '', 'ινσς')
+
+    @classmethod
+    def reducePlain(cls, plain):
+        """Leaves ι, ν, σ and ς out of a plain word"""
+        return plain.translate(cls.REDUCED_table)
+
     @classmethod
     def cleanPlain(cls, token, split=True):
         if split:
             pre, word, post = token
-            return ''.join((c for c in cls.plainWord(word, split=False) if not c in {'ι', 'ν', 'σ', 'ς'}))
+            return cls.reducePlain(cls.plainWord(word, split=False))
         else:
-            return ''.join((c for c in cls.plainWord(token) if not c in {'ι', 'ν', 'σ', 'ς'}))
+            return cls.reducePlain(cls.plainWord(token, split=False))
 
 
 class Latin(Generic):
@@ -3,7 +3,7 @@
 # Lemmatizer for Greek text
 # 
 # This file provides a function (createLemmatizer) 
-# that creates (pickles) a dictionary that contains 
+# that creates a dictionary that contains 
 # Greek wordforms as its keys and its possible lemmata as values (set). 
 # It also provides a function (lemmatize) that takes two arguments: 
 #   - a wordstring 
@@ -11,10 +11,23 @@
 # It returns a string with the possible lemmata in comma-separated format.
 # 
 # If you like to use these functions, be aware to load the lemmatizer (=lemma dictionary) only once...
+#
+# The dictionary is not stored as a pickle, but as a binary index
+# (see writeLemmaIndex), that is memory-mapped by LemmaIndex. Loading it
+# takes milliseconds, and its pages are shared by all processes that use it.
 
+import sys
+import mmap
+import struct
 import pickle
+import tempfile
+from array import array
+from bisect import bisect_right
 from unicodedata import normalize, category
-from os import path
+from os import path, remove, close
+from functools import lru_cache
+from operator import itemgetter
+from multiprocessing import Pool, cpu_count
 import xml.etree.ElementTree as etree
 from tf.fabric import Timestamp
 
@@ -45,95 +58,138 @@ MANUAL_FORMS = {
 }
     
 # helper function
+# NB the same strings are stripped many times while building the lemmatizer
+@lru_cache(maxsize=2**20)
 def strip_accents(word):
     return ''.join(c for c in normalize(udnorm, word.lower())
                    if category(c)[0] in letter)
 
 
-def createLemmatizer(sourcepath1, sourcepath2):
-    lemma_dict = {}
-    with open(sourcepath1) as source1:
-        for line in source1:
-            form, alternative, morphology, lemma = line.strip().split("\t")
+# SOURCES OF THE LEMMATIZER
+# Every source is read as a stream of entries, that are sent in chunks
+# to sourceForms (in parallel); the forms of an entry are the keys
+# under which its lemma is stored.
+def tsvEntries(sourcepath):
+    """Yields the lines of a tab-separated source:
+    form, alternative, morphology, lemma
+    """
+    with open(sourcepath) as source:
+        yield from source
+
+
+def morpheusEntries(sourcepath, fields=('f', 'b', 'l')):
+    """Yields the fields of every <t> element of MorpheusUnicode.xml,
+    by default (form, bare form, lemma); the XML is parsed incrementally,
+    and the tree is cleared after every entry, so that it stays small
+    """
+    root = None
+    for event, elem in etree.iterparse(sourcepath, events=('start', 'end')):
+        if root is None:
+            root = elem
+        elif event == 'end' and elem.tag == 't':
+            yield tuple(elem.findtext(field) for field in fields)
+            root.clear()
+
+
+def sourceForms(kind, chunk, lemma_dict=None):
+    """Adds the forms of a chunk of entries of a source of the
+    kind 'tsv', 'morpheus' or 'pairs' to lemma_dict; if no
+    lemma_dict is given, a new (partial) one is made.
+
+    returns lemma_dict
+    """
+    if lemma_dict is None:
+        lemma_dict = {}
+    for entry in chunk:
+        if kind == 'tsv':
+            form, alternative, morphology, lemma = entry.strip().split("\t")
             form1 = normalize(udnorm, form.lower())
-            form2 = strip_accents(form1)
             alternative1 = normalize(udnorm, alternative.lower())
-            alternative2 = strip_accents(alternative1)
-            lemma = normalize(udnorm, lemma.lower())
-            if form1 in lemma_dict:
-                lemma_dict[form1].add(lemma)
-            else:
-                lemma_dict[form1] = {lemma}
-            if form2 in lemma_dict:
-                lemma_dict[form2].add(lemma)
-            else:
-                lemma_dict[form2] = {lemma}
-                
-            if alternative1 in lemma_dict:
-                lemma_dict[alternative1].add(lemma)
-            else:
-                lemma_dict[alternative1] = {lemma}
-            if alternative2 in lemma_dict:
-                lemma_dict[alternative2].add(lemma)
-            else:
-                lemma_dict[alternative2] = {lemma}
-                
-    with open(sourcepath2) as source2:
-        tree = etree.parse(source2)
-        for elem in tree.iter('t'):
-            form1a = normalize(udnorm, elem.findtext('f').lower())
-            form2a = normalize(udnorm, elem.findtext('b').lower())
-            form1b = strip_accents(elem.findtext('f').lower())
-            form2b = strip_accents(elem.findtext('b').lower())
-            lemma = normalize(udnorm, elem.findtext('l').lower())
-            if form1a in lemma_dict:
-                lemma_dict[form1a].add(lemma)
-            else:
-                lemma_dict[form1a] = {lemma}
-            if form2a in lemma_dict:
-                lemma_dict[form2a].add(lemma)
-            else:
-                lemma_dict[form2a] = {lemma}
-                
-            if form1b in lemma_dict:
-                lemma_dict[form1b].add(lemma)
+            forms = (form1, strip_accents(form1), alternative1, strip_accents(alternative1))
+        elif kind == 'morpheus':
+            form, bare, lemma = entry
+            forms = (normalize(udnorm, form.lower()), normalize(udnorm, bare.lower()),
+                     strip_accents(form.lower()), strip_accents(bare.lower()))
+        else:
+            form, lemma = entry
+            forms = (normalize(udnorm, form.lower()), strip_accents(form.lower()))
+        lemma = normalize(udnorm, lemma.lower())
+        for form in forms:
+            if form in lemma_dict:
+                lemma_dict[form].add(lemma)
             else:
-                lemma_dict[form1b] = {lemma}
-            if form2b in lemma_dict:
-                lemma_dict[form2b].add(lemma)
+                lemma_dict[form] = {lemma}
+    return lemma_dict
+
+
+def sourceFormsStar(args):
+    return sourceForms(*args)
+
+
+def chunked(entries, chunk_size):
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def createLemmatizer(sourcepath1=SOURCE1, sourcepath2=SOURCE2, indexpath=SRC_DIR + '/lemmatizer.index',
+                     processes=None, chunk_size=20000, fuzzypath=None, max_distance=2):
+    """Creates the lemmatizer from its sources and writes it
+    as a binary index to indexpath (see writeLemmaIndex).
+
+    The sources are streamed in chunks of chunk_size entries,
+    which are processed by a pool of processes (None means: as
+    many as there are cores; with 1 process no pool is used). The partial
+    dictionaries are merged in the order of the sources, so that
+    the result does not depend on the number of processes.
+
+    If fuzzypath is given, the fuzzy index (see writeFuzzyIndex)
+    is written as well.
+
+    returns the lemma dictionary
+    """
+    try:
+        from data.greek_lemmata_cltk import LEMMATA
+    except ImportError:
+        LEMMATA = {}
+    sources = (
+        ('tsv', sourcepath1, tsvEntries(sourcepath1)),
+        ('morpheus', sourcepath2, morpheusEntries(sourcepath2)),
+        ('pairs', 'LEMMATA', iter(LEMMATA.items())),
+        ('pairs', 'MANUAL_FORMS', iter(MANUAL_FORMS.items())),
+    )
+
+    tm = Timestamp()
+    processes = processes or cpu_count()
+    pool = Pool(processes) if processes > 1 else None
+    lemma_dict = {}
+    try:
+        for kind, name, entries in sources:
+            tm.indent(level=0, reset=True)
+            tm.info(f'reading {name}...')
+            if pool:
+                chunks = ((kind, chunk) for chunk in chunked(entries, chunk_size))
+                for partial in pool.imap(sourceFormsStar, chunks):
+                    for form, lemmata in partial.items():
+                        if form in lemma_dict:
+                            lemma_dict[form].update(lemmata)
+                        else:
+                            lemma_dict[form] = lemmata
             else:
-                lemma_dict[form2b] = {lemma}
-        tree = None
-        
-    from data.greek_lemmata_cltk import LEMMATA
-        
-    for key, value in LEMMATA.items():
-        formA = normalize(udnorm, key.lower())
-        formB = strip_accents(key.lower())
-        lemma = normalize(udnorm, value.lower())
-        if formA in lemma_dict:
-            lemma_dict[formA].add(lemma)
-        else:
-            lemma_dict[formA] = {lemma}
-        if formB in lemma_dict:
-            lemma_dict[formB].add(lemma)
-        else:
-            lemma_dict[formB] = {lemma}
-            
-    for key, value in MANUAL_FORMS.items():
-        formA = normalize(udnorm, key.lower())
-        formB = strip_accents(key.lower())
-        lemma = normalize(udnorm, value.lower())
-        if formA in lemma_dict:
-            lemma_dict[formA].add(lemma)
-        else:
-            lemma_dict[formA] = {lemma}
-        if formB in lemma_dict:
-            lemma_dict[formB].add(lemma)
-        else:
-            lemma_dict[formB] = {lemma}
-    
+                sourceForms(kind, entries, lemma_dict)
+            tm.info(f'{name} done: {len(lemma_dict)} forms in total')
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
     # Handle movable-nu and final-sigma
+    tm.indent(level=0, reset=True)
     lemma_dict_add = {}
     for wordform in lemma_dict:
         if strip_accents(wordform).endswith(('εν', 'σιν', 'στιν')) and len(strip_accents(wordform)) > 2:
@@ -147,12 +203,387 @@ def createLemmatizer(sourcepath1, sourcepath2):
             else:
                 lemma_dict_add[wordform[:-1] + 'ς'] = lemma_dict[wordform]
     lemma_dict.update(lemma_dict_add)
-    
-    with open(SRC_DIR + '/lemmatizer.pickle', 'wb') as lemmatizer:
-        pickle.dump(lemma_dict, lemmatizer, protocol=pickle.HIGHEST_PROTOCOL)
-    
-# Run the creation process    
-# createLemmatizer(SOURCE1, SOURCE2)
+    tm.info(f'movable-nu and final-sigma done: {len(lemma_dict)} forms in total')
+
+    tm.indent(level=0, reset=True)
+    writeLemmaIndex(lemma_dict, indexpath)
+    tm.info(f'index written to {indexpath}')
+
+    if fuzzypath:
+        tm.indent(level=0, reset=True)
+        writeFuzzyIndex(lemma_dict, fuzzypath, max_distance=max_distance)
+        tm.info(f'fuzzy index written to {fuzzypath}')
+    return lemma_dict
+
+
+# Run the creation process from the tfbuilder directory with:
+#   python -m helpertools.lemmatizer [--source1 PATH] [--source2 PATH] [--index PATH] [--processes N]
+#                                    [--fuzzy PATH] [--max-distance N]
+
+
+# BINARY LEMMA INDEX
+# The index file consists of a header and six sections:
+#   key_offsets    (n_keys + 1) x uint32: offsets of the keys in the key pool
+#   value_offsets  (n_keys + 1) x uint32: offsets of the lemma ids of a key in values
+#   values         n_values x uint32: lemma ids
+#   lemma_offsets  (n_lemmas + 1) x uint32: offsets of the lemmata in the lemma pool
+#   key pool       the UTF-8 encoded keys, sorted bytewise
+#   lemma pool     the UTF-8 encoded lemmata, sorted bytewise
+# All integers are little-endian.
+INDEX_MAGIC = b'TFLEMMA1'
+INDEX_HEADER = struct.Struct('<8sIII')
+
+
+def writeLemmaIndex(lemma_dict, indexpath):
+    """Writes a lemma dictionary {wordform: {lemma, ...}}
+    as a binary index to indexpath (see LemmaIndex)
+    """
+    # NB sorting by code point is the same as sorting the UTF-8 encoded bytes
+    keys = sorted(lemma_dict.items(), key=itemgetter(0))
+    lemmata = sorted({l for v in lemma_dict.values() for l in v})
+    lemma_ids = {l: i for i, l in enumerate(lemmata)}
+    keys = [(k.encode('utf8'), v) for k, v in keys]
+    lemmata = [l.encode('utf8') for l in lemmata]
+
+    key_offsets, value_offsets, values, lemma_offsets = \
+        array('I', [0]), array('I', [0]), array('I'), array('I', [0])
+    for k, v in keys:
+        key_offsets.append(key_offsets[-1] + len(k))
+        values.extend(sorted(lemma_ids[l] for l in v))
+        value_offsets.append(len(values))
+    for l in lemmata:
+        lemma_offsets.append(lemma_offsets[-1] + len(l))
+    if sys.byteorder != 'little':
+        for a in (key_offsets, value_offsets, values, lemma_offsets):
+            a.byteswap()
+
+    with open(indexpath, 'wb') as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, len(keys), len(values), len(lemmata)))
+        for a in (key_offsets, value_offsets, values, lemma_offsets):
+            a.tofile(index)
+        index.write(b''.join(k for k, v in keys))
+        index.write(b''.join(lemmata))
+
+
+def pickleToIndex(picklepath, indexpath):
+    """Converts a pickled lemma dictionary
+    (as made by earlier versions of createLemmatizer)
+    into a binary index
+    """
+    with open(picklepath, 'rb') as lemmatizer:
+        writeLemmaIndex(pickle.load(lemmatizer), indexpath)
+
+
+def shareLemmatizer(lemmatizer):
+    """Returns a lemmatizer that worker processes can share without
+    copying it. A LemmaIndex is returned as it is; a lemma dictionary
+    is written to a temporary index file first, which is removed
+    when the returned LemmaIndex is closed.
+
+    NB the pages of a dictionary are copied into every (forked)
+    worker that uses it, because looking up keys updates their
+    reference counts; the pages of a LemmaIndex are never written.
+    """
+    if isinstance(lemmatizer, LemmaIndex):
+        return lemmatizer
+    fd, indexpath = tempfile.mkstemp(suffix='.index', prefix='lemmatizer-')
+    close(fd)
+    writeLemmaIndex(lemmatizer, indexpath)
+    index = LemmaIndex(indexpath)
+    index.temporary = True
+    return index
+
+
+class LemmaIndex:
+    """LemmaIndex gives read-only access to a binary lemma index
+    (see writeLemmaIndex) with the same interface as the lemma
+    dictionary it has been made of:
+        word in lemmatizer
+        lemmatizer[word] -> (lemma, ...)
+    The file is memory-mapped, so that nothing is loaded in advance
+    and all processes that open it share the same pages. Keys are
+    found by a binary search over the sorted keys, of which
+    every FENCE-th one is kept in memory.
+
+    NB a LemmaIndex can be pickled (e.g. to send it to another
+    process); it is then reopened from its path.
+    """
+    FENCE = 256
+    temporary = False   # Remove the file on close() (see shareLemmatizer)
+
+    def __init__(self, indexpath):
+        self.indexpath = indexpath
+        with open(indexpath, 'rb') as index:
+            self.mm = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_keys, n_values, self.n_lemmas = INDEX_HEADER.unpack_from(self.mm)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f'{indexpath} is not a lemma index')
+
+        pos = INDEX_HEADER.size
+        sections = []
+        for n in (self.n_keys + 1, self.n_keys + 1, n_values, self.n_lemmas + 1):
+            sections.append(self.uint32(pos, n))
+            pos += 4 * n
+        self.key_offsets, self.value_offsets, self.values, self.lemma_offsets = sections
+        self.key_pool = pos
+        self.lemma_pool = pos + self.key_offsets[-1]
+        # Every FENCE-th key is kept in memory, to narrow down the binary search
+        self.fence = [self.key(i) for i in range(0, self.n_keys, self.FENCE)]
+
+    def uint32(self, pos, n):
+        if sys.byteorder == 'little':
+            return memoryview(self.mm)[pos:pos + 4 * n].cast('I')
+        # Big-endian machines need a (byteswapped) copy
+        a = array('I', self.mm[pos:pos + 4 * n])
+        a.byteswap()
+        return a
+
+    def __getstate__(self):
+        return self.indexpath
+
+    def __setstate__(self, indexpath):
+        self.__init__(indexpath)
+
+    def __len__(self):
+        return self.n_keys
+
+    def key(self, i):
+        return self.mm[self.key_pool + self.key_offsets[i]:self.key_pool + self.key_offsets[i + 1]]
+
+    def lemma(self, i):
+        return self.mm[self.lemma_pool + self.lemma_offsets[i]:
+                       self.lemma_pool + self.lemma_offsets[i + 1]].decode('utf8')
+
+    def find(self, word):
+        """Returns the position of word in the index, or -1"""
+        key = word.encode('utf8')
+        mm, key_pool, key_offsets = self.mm, self.key_pool, self.key_offsets
+        lo = (bisect_right(self.fence, key) - 1) * self.FENCE
+        if lo < 0:
+            return -1
+        hi = end = min(lo + self.FENCE, self.n_keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mm[key_pool + key_offsets[mid]:key_pool + key_offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < end and self.key(lo) == key:
+            return lo
+        return -1
+
+    def __contains__(self, word):
+        return self.find(word) != -1
+
+    def __getitem__(self, word):
+        i = self.find(word)
+        if i == -1:
+            raise KeyError(word)
+        return tuple(self.lemma(l) for l in self.values[self.value_offsets[i]:self.value_offsets[i + 1]])
+
+    def get(self, word, default=None):
+        try:
+            return self[word]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return (self.key(i).decode('utf8') for i in range(self.n_keys))
+
+    def close(self):
+        self.key_offsets = self.value_offsets = self.values = self.lemma_offsets = self.fence = None
+        self.mm.close()
+        if self.temporary:
+            remove(self.indexpath)
+
+
+# FUZZY LEMMA INDEX
+# The fuzzy index finds the known plain forms of the lemmatizer that are
+# nearest to an unknown plain form, using symmetric deletes (SymSpell):
+# every plain form is stored under all strings that result from deleting
+# up to max_distance of its characters (or of its first prefix_length
+# characters, if given). Forms within max_distance edits of a word share
+# at least one of these delete variants with the word. Since the variants
+# are made of the whole form, every variant leads to few forms. The fuzzy index is stored as a lemma
+# index of {delete variant: {plain form, ...}}, next to the lemmatizer.
+FUZZY_PARAMS = '\x00'   # Key under which max_distance and prefix_length are stored
+
+
+def deletes(word, max_distance):
+    """Returns the set of strings that result from deleting
+    up to max_distance characters from word (including word)
+    """
+    result = {word}
+    edits = {word}
+    for _ in range(max_distance):
+        edits = {w[:i] + w[i + 1:] for w in edits for i in range(len(w))}
+        result |= edits
+    return result
+
+
+def editDistance(a, b, max_distance):
+    """Returns the Levenshtein distance between a and b,
+    or max_distance + 1 if it is larger than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # The common prefix and suffix do not change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    a, b = a[start:], b[start:]
+    while a and b and a[-1] == b[-1]:
+        a, b = a[:-1], b[:-1]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+    # Strings of the same length that differ in their first and their
+    # last character are two edits apart if their middles are equal
+    # (two substitutions) or if one is the other shifted by one
+    if len(a) == len(b) and max_distance <= 2:
+        if len(a) == 1:
+            return 1
+        if len(a) == 2 or a[1:-1] == b[1:-1] or a[1:] == b[:-1] or a[:-1] == b[1:]:
+            return min(2, max_distance + 1)
+        return max_distance + 1
+    # Only the cells within max_distance of the diagonal can be
+    # at most max_distance, the others are kept at limit
+    limit = max_distance + 1
+    previous = [j if j < limit else limit for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, start=1):
+        current = [i if i < limit else limit] + [limit] * len(b)
+        low, high = max(1, i - max_distance), min(len(b), i + max_distance)
+        smallest = current[0]
+        for j in range(low, high + 1):
+            distance = previous[j - 1] + (ca != b[j - 1])
+            if current[j - 1] + 1 < distance:
+                distance = current[j - 1] + 1
+            if previous[j] + 1 < distance:
+                distance = previous[j] + 1
+            if distance > limit:
+                distance = limit
+            current[j] = distance
+            if distance < smallest:
+                smallest = distance
+        if smallest >= limit:
+            return limit
+        previous = current
+    return previous[-1]
+
+
+def writeFuzzyIndex(lemmatizer, fuzzypath, max_distance=2, prefix_length=None):
+    """Writes the fuzzy index of the plain forms (see strip_accents)
+    among the keys of a lemmatizer (a lemma dictionary or a LemmaIndex)
+    to fuzzypath (see FuzzyIndex)
+
+    NB the number of delete variants grows quickly with max_distance
+    and prefix_length; a prefix_length (e.g. 7, like SymSpell) makes the
+    index smaller, but the lookups slower, since the forms that share a
+    prefix end up under the same variants.
+    """
+    delete_dict = {FUZZY_PARAMS: {f'{max_distance} {prefix_length or 0}'}}
+    for form in lemmatizer:
+        if form and strip_accents(form) == form:
+            for variant in deletes(form[:prefix_length], max_distance):
+                if variant in delete_dict:
+                    delete_dict[variant].add(form)
+                else:
+                    delete_dict[variant] = {form}
+    writeLemmaIndex(delete_dict, fuzzypath)
+
+
+class FuzzyIndex:
+    """FuzzyIndex finds the nearest known plain forms of a plain form
+    with a fuzzy index made by writeFuzzyIndex (memory-mapped, like
+    LemmaIndex):
+        fuzzy.nearest(word) -> (distance, (form, ...))
+
+    Most delete variants of a word are not in the index. So that they
+    need no binary search, a filter of the hashes of the variants in
+    the index is kept in memory (FILTER_BITS bits per variant); it is
+    made when the index is opened, since the hashes of strings differ
+    between processes.
+    """
+    FILTER_BITS = 16
+
+    def __init__(self, fuzzypath):
+        self.index = LemmaIndex(fuzzypath)
+        max_distance, prefix_length = self.index[FUZZY_PARAMS][0].split()
+        self.max_distance = int(max_distance)
+        self.prefix_length = int(prefix_length) or None
+        self.mask = (1 << max(3, (self.index.n_keys * self.FILTER_BITS).bit_length())) - 1
+        self.filter = bytearray((self.mask + 1) >> 3)
+        for variant in self.index:
+            h = hash(variant) & self.mask
+            self.filter[h >> 3] |= 1 << (h & 7)
+
+    def nearest(self, word, max_distance=None):
+        """Returns the forms at the smallest edit distance from word,
+        up to max_distance (at most the max_distance of the index)
+
+        returns (distance, (form, ...)) or (None, ()) if there are none
+        """
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        index, filter, mask = self.index, self.filter, self.mask
+        values, value_offsets = index.values, index.value_offsets
+        # A form at distance d shares a variant with word that is at most
+        # d deletes away from word, so the search by increasing number of
+        # deletes stops as soon as it exceeds the best distance found.
+        # Without a prefix_length, the variants are made of whole forms, so
+        # that a form that is met first at k deletes from word is at least
+        # k edits away, plus the number of characters it is longer than
+        # word, and at most k + j, if the variant is j deletes from it.
+        whole = self.prefix_length is None
+        best, forms = max_distance + 1, set()
+        checked = set()     # The ids of the forms that have been met
+        level = {word[:self.prefix_length]}
+        for deleted in range(max_distance + 1):
+            if deleted > best:
+                break
+            for variant in level:
+                h = hash(variant) & mask
+                if not filter[h >> 3] & 1 << (h & 7):
+                    continue
+                i = index.find(variant)
+                if i == -1:
+                    continue
+                for form_id in values[value_offsets[i]:value_offsets[i + 1]]:
+                    if form_id in checked:
+                        continue
+                    checked.add(form_id)
+                    form = index.lemma(form_id)
+                    # The difference in length is the least number of edits
+                    diff = len(form) - len(word)
+                    if not whole:
+                        least = abs(diff)
+                    elif diff > 0:
+                        least = deleted + diff
+                    else:
+                        least = max(deleted, -diff)
+                    if least > best or least > max_distance:
+                        continue
+                    extra = len(form) - len(variant)
+                    if whole and least == deleted + extra:
+                        distance = least
+                    elif whole and deleted == extra == 1:
+                        # A substitution, or else a delete and an insert
+                        distance = 1 if sum(a != b for a, b in zip(word, form)) == 1 else 2
+                    else:
+                        distance = editDistance(word, form, min(best, max_distance))
+                    if distance > max_distance:
+                        continue
+                    if distance < best:
+                        best, forms = distance, {form}
+                    elif distance == best:
+                        forms.add(form)
+            if deleted < min(best, max_distance):
+                level = {v[:i] + v[i + 1:] for v in level for i in range(len(v))}
+        if not forms:
+            return None, ()
+        return best, tuple(sorted(forms))
+
+    def close(self):
+        self.index.close()
 
 
 def lemmatize(word, lemmatizer):
@@ -166,15 +597,27 @@ def lemmatize(word, lemmatizer):
 
 # Small test setup
 
-# lemmatizer_open = open(SRC_DIR + '/lemmatizer.pickle', 'rb')
-# lemmatizer = pickle.load(lemmatizer_open)
+# lemmatizer = LemmaIndex(SRC_DIR + '/lemmatizer.index')
 
 # selection = {k: v for k, v in sorted(lemmatizer.items())[:100]}
 # pprint(selection)
 # pprint(f'The total number of available wordforms = {len(lemmatizer)}')
 
 # lemmatize('ἐΠράχθη', lemmatizer)
-# lemmatizer_open.close()
-
+# lemmatizer.close()
 
 
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Creates the lemmatizer index from its sources')
+    parser.add_argument('--source1', default=SOURCE1, help='tab-separated forms file')
+    parser.add_argument('--source2', default=SOURCE2, help='MorpheusUnicode.xml')
+    parser.add_argument('--index', default=SRC_DIR + '/lemmatizer.index', help='index file to be written')
+    parser.add_argument('--processes', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='number of entries per chunk')
+    parser.add_argument('--fuzzy', default=None, help='fuzzy index file to be written as well')
+    parser.add_argument('--max-distance', type=int, default=2, help='maximum edit distance of the fuzzy index')
+    args = parser.parse_args()
+    createLemmatizer(args.source1, args.source2, indexpath=args.index,
+                     processes=args.processes, chunk_size=args.chunk_size,
+                     fuzzypath=args.fuzzy, max_distance=args.max_distance)
@@ -0,0 +1,84 @@
+# coding: utf-8
+
+# Morphology for Greek text
+#
+# This file provides a function (createMorphology) that creates
+# an index that contains the Greek wordforms of MorpheusUnicode.xml
+# as its keys and their possible parse codes as values, e.g.
+#   'λόγος' -> ('n-s---mn-',)
+# The parse codes are the 9-character morphological tags of Morpheus
+# (part of speech, person, number, tense, mood, voice, gender, case, degree).
+#
+# The index has the same binary format as the lemmatizer (see
+# writeLemmaIndex), so that it is memory-mapped by LemmaIndex as well;
+# with a few hundred distinct parse codes, it is very compact.
+
+from unicodedata import normalize
+from tf.fabric import Timestamp
+
+# Local imports
+from helpertools.lemmatizer import SRC_DIR, SOURCE2, udnorm, strip_accents, morpheusEntries, writeLemmaIndex
+
+MORPH_INDEX = SRC_DIR + '/morphology.index'
+
+
+def morphologyForms(entries, morph_dict=None):
+    """Adds the forms of (form, bare form, parse code) entries, and
+    their plain forms, to morph_dict; if no morph_dict is given, a
+    new one is made. Entries without a parse code are skipped.
+
+    returns morph_dict
+    """
+    if morph_dict is None:
+        morph_dict = {}
+    for form, bare, parse in entries:
+        if not form or not parse:
+            continue
+        forms = {normalize(udnorm, form.lower()), strip_accents(form)}
+        if bare:
+            forms.update((normalize(udnorm, bare.lower()), strip_accents(bare)))
+        parse = parse.strip()
+        for form in forms:
+            if form in morph_dict:
+                morph_dict[form].add(parse)
+            else:
+                morph_dict[form] = {parse}
+    return morph_dict
+
+
+def createMorphology(sourcepath=SOURCE2, indexpath=MORPH_INDEX):
+    """Creates the morphology from MorpheusUnicode.xml, which is
+    streamed (see morpheusEntries), and writes it as a binary
+    index to indexpath (see writeLemmaIndex).
+
+    returns the morphology dictionary
+    """
+    tm = Timestamp()
+    tm.info(f'reading {sourcepath}...')
+    morph_dict = morphologyForms(morpheusEntries(sourcepath, fields=('f', 'b', 'p')))
+    tm.info(f'{sourcepath} done: {len(morph_dict)} forms in total')
+
+    # Handle final-sigma
+    tm.indent(level=0, reset=True)
+    morph_dict_add = {}
+    for wordform in morph_dict:
+        if wordform.endswith('σ') and wordform[:-1] + 'ς' not in morph_dict:
+            morph_dict_add[wordform[:-1] + 'ς'] = morph_dict[wordform]
+    morph_dict.update(morph_dict_add)
+    tm.info(f'final-sigma done: {len(morph_dict)} forms in total')
+
+    tm.indent(level=0, reset=True)
+    writeLemmaIndex(morph_dict, indexpath)
+    tm.info(f'index written to {indexpath}')
+    return morph_dict
+
+
+# Run the creation process from the tfbuilder directory with:
+#   python -m helpertools.morphology [--source PATH] [--index PATH]
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Creates the morphology index from MorpheusUnicode.xml')
+    parser.add_argument('--source', default=SOURCE2, help='MorpheusUnicode.xml')
+    parser.add_argument('--index', default=MORPH_INDEX, help='index file to be written')
+    args = parser.parse_args()
+    createMorphology(args.source, indexpath=args.index)
@@ -0,0 +1,249 @@
+# Scheduler.py contains the scheduling of the files of a
+# conversion over the workers of a pool: the files are
+# dispatched in longest-processing-time-first (LPT) order,
+# so that the largest works do not start last and keep
+# a single worker busy after all others have finished.
+# The workers are recycled after a number of files or
+# above a memory threshold, and a file that exceeds its
+# time or memory budget is aborted without stopping the run.
+
+import pickle
+import heapq
+from os import path, replace, getpid, sysconf
+from time import time
+from collections import deque
+from statistics import median
+from multiprocessing import get_context, connection
+
+PAGE_SIZE = sysconf('SC_PAGE_SIZE')
+
+
+def loadTimings(filepath):
+    '''Returns the timings of earlier runs as a dict
+    {file: (size, seconds)}; if there are none, an empty dict
+    '''
+    if not path.isfile(filepath):
+        return {}
+    with open(filepath, 'rb') as f:
+        return pickle.load(f)
+
+
+def saveTimings(filepath, timings, results):
+    '''Adds the size and seconds of the converted files of results
+    (see tfbuilder.FileResult) to timings and saves them to filepath
+    '''
+    for result in results:
+        if result.status == 'converted':
+            timings[path.abspath(result.file)] = (path.getsize(result.file), result.seconds)
+    with open(filepath + '.tmp', 'wb') as f:
+        pickle.dump(timings, f, protocol=pickle.HIGHEST_PROTOCOL)
+    replace(filepath + '.tmp', filepath)
+
+
+def estimateCosts(files, timings=None):
+    '''Estimates the cost of the conversion of every file in seconds
+
+    A file that has been converted before costs the seconds it took
+    then, scaled by the change of its size; any other file costs its
+    size times the median seconds per byte of the earlier runs. Without
+    timings, the cost of a file is its size (in bytes instead of seconds).
+
+    returns a dict {file: cost}
+    '''
+    timings = timings or {}
+    rates = [seconds / size for size, seconds in timings.values() if size]
+    rate = median(rates) if rates else 1.0
+    costs = {}
+    for file in files:
+        size = path.getsize(file)
+        timing = timings.get(path.abspath(file))
+        if timing and timing[0]:
+            costs[file] = timing[1] * size / timing[0]
+        else:
+            costs[file] = size * rate
+    return costs
+
+
+def lptOrder(files, costs):
+    '''Returns the files in longest-processing-time-first order'''
+    return sorted(files, key=lambda file: costs[file], reverse=True)
+
+
+def simulateMakespan(costs, workers):
+    '''Returns the makespan of a list of costs, if every cost
+    is given in turn to the first worker that becomes idle
+    '''
+    idle = [0.0] * workers
+    for cost in costs:
+        heapq.heapreplace(idle, idle[0] + cost)
+    return max(idle)
+
+
+def idealMakespan(costs, workers):
+    '''Returns the lower bound of the makespan of a list of costs:
+    the total divided over the workers, or the largest single cost
+    '''
+    return max(sum(costs) / workers, max(costs, default=0))
+
+
+def makespanSummary(makespan, costs, workers):
+    '''Returns a summary of the makespan of a run against the ideal'''
+    ideal = idealMakespan(costs, workers)
+    return f'makespan {round(makespan, 2)} s against an ideal of {round(ideal, 2)} s ' \
+        f'({round(ideal / makespan * 100, 2) if makespan else 100}%, {workers} workers)'
+
+
+def processRSS(pid):
+    '''Returns the current resident memory of process pid in bytes,
+    or None if it cannot be read (it needs the /proc filesystem)
+    '''
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def fileWorker(conn, func, initializer=None, initargs=(), recycle_after=None, recycle_rss=None):
+    '''Runs func for the files it receives through conn, its private
+    end of a Pipe to the parent, until it receives None, or until it
+    has to be recycled: after recycle_after files or once its resident
+    memory exceeds recycle_rss bytes. Every file is announced with the
+    resident memory at its start, so that the parent knows which file
+    a worker is working on and how much memory the file has added.
+    If an initializer is given, it is called with initargs first.
+    '''
+    if initializer is not None:
+        initializer(*initargs)
+    pid = getpid()
+    done = 0
+    while True:
+        file = conn.recv()
+        if file is None:
+            return
+        conn.send(('start', processRSS(pid)))
+        result = func(file)
+        done += 1
+        recycle = bool((recycle_after and done >= recycle_after) or
+                       (recycle_rss and (processRSS(pid) or 0) > recycle_rss))
+        conn.send(('done', (result, recycle)))
+        if recycle:
+            return
+
+
+def runWorkers(func, files, workers, initializer=None, initargs=(), recycle_after=None, recycle_rss=None,
+               file_timeout=None, file_rss=None, failed=None, poll=0.5, context=None):
+    '''Runs func (that returns a tfbuilder.FileResult) for all files in
+    workers processes, and yields the results in order of completion
+
+    Every worker calls initializer(*initargs) before its first file;
+    func, initializer and initargs need to be picklable, unless the
+    workers are forked. context is the multiprocessing context of the
+    workers; by default the one of the default start method.
+
+    The files are given one by one to the first idle worker, in the
+    order of files. A worker is replaced by a fresh one after
+    recycle_after files or once its resident memory exceeds recycle_rss
+    bytes, so that the memory of large files is returned. A worker that
+    works longer than file_timeout seconds on a single file (counted
+    from its start, so that the initializer of a new worker is left
+    out), of which the resident memory grows by more than file_rss
+    bytes during a single file, or that dies, is killed and replaced;
+    its file gets the result failed(file, seconds, rss, reason).
+
+    Every worker has a Pipe of its own, so that killing a worker
+    cannot affect the others, and a worker is only killed if it has
+    not sent anything yet that the parent has not read.
+    '''
+    context = context or get_context()
+    pending = deque(files)
+    procs = {}          # pid: (process, conn)
+    current = {}        # pid: (file, start, rss at start); both are None until the worker starts the file
+    closed = set()      # pids of which the end of the Pipe has been reached
+
+    def startWorker():
+        conn, child_conn = context.Pipe()
+        proc = context.Process(target=fileWorker, args=(child_conn, func, initializer, initargs, recycle_after, recycle_rss),
+                               daemon=True)
+        proc.start()
+        child_conn.close()
+        procs[proc.pid] = (proc, conn)
+        return proc.pid
+
+    def dispatch(pid):
+        # Sends the next file to a worker; without files, the worker is stopped
+        proc, conn = procs[pid]
+        if pending:
+            file = pending.popleft()
+            current[pid] = (file, None, None)
+            try:
+                conn.send(file)
+            except OSError:
+                # The worker has died; the file fails below
+                pass
+        else:
+            try:
+                conn.send(None)
+            except OSError:
+                # The worker has exited already
+                pass
+            removeWorker(pid)
+
+    def removeWorker(pid, kill=False):
+        proc, conn = procs.pop(pid)
+        current.pop(pid, None)
+        closed.discard(pid)
+        if kill:
+            proc.kill()
+        proc.join()
+        conn.close()
+
+    for _ in range(min(workers, len(pending))):
+        dispatch(startWorker())
+
+    while procs:
+        ready = connection.wait([conn for proc, conn in procs.values()], timeout=poll)
+        for pid, (proc, conn) in list(procs.items()):
+            if conn not in ready:
+                continue
+            try:
+                message, value = conn.recv()
+            except (EOFError, OSError):
+                # The worker has died; it is handled below
+                closed.add(pid)
+                continue
+            if message == 'start':
+                # The time budget starts here, so that it excludes the initializer of a new worker
+                file, _, _ = current[pid]
+                current[pid] = (file, time(), value)
+            elif message == 'done':
+                result, recycle = value
+                current.pop(pid, None)
+                yield result
+                if recycle:
+                    removeWorker(pid)
+                    if pending:
+                        dispatch(startWorker())
+                else:
+                    dispatch(pid)
+
+        # Kill the workers that exceed the budget of their file, and replace the ones that died;
+        # a worker that has sent something that has not been read yet is left alone, even if it
+        # has exited since (e.g. after its last result), until the end of its Pipe is reached
+        for pid, (proc, conn) in list(procs.items()):
+            if pid not in current or (pid not in closed and conn.poll()):
+                continue
+            file, start, start_rss = current[pid]
+            rss = processRSS(pid)
+            if not proc.is_alive():
+                reason = f'the worker died (exit code {proc.exitcode})'
+            elif file_timeout and start and time() - start > file_timeout:
+                reason = f'the time budget of {file_timeout} s was exceeded'
+            elif file_rss and rss and start_rss and rss - start_rss > file_rss:
+                reason = f'the memory budget of {round(file_rss / 2**20, 1)} MB was exceeded'
+            else:
+                continue
+            removeWorker(pid, kill=True)
+            yield failed(file, time() - start if start else 0.0, rss or 0, reason)
+            if pending:
+                dispatch(startWorker())
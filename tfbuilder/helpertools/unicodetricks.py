@@ -9,6 +9,12 @@
 
 from unicodedata import category, normalize
 
+# NumPy is only needed for the splitPuncArray backend
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # letter = {'L'}
 # space = {'Z'}
 # letter_space = {'L', 'Z'}
@@ -25,6 +31,62 @@ letter_dia = letter | dia
 
 udnorm = 'NFC'
 
+# Character classes
+# Every codepoint of the BMP is classified once in CLASS_TABLE,
+# so that the functions below do not need to call category()
+# followed by a set lookup for every character. Codepoints above
+# the BMP fall back on category().
+LETTER = 1
+DIA = 2
+SPACE = 4
+PUNC = 8
+LETTER_DIA = LETTER | DIA
+
+CATEGORY_CLASS = {**{cat: LETTER for cat in letter},
+                  **{cat: DIA for cat in dia},
+                  **{cat: SPACE for cat in space},
+                  **{cat: PUNC for cat in punc}}
+CLASS_TABLE = bytearray(CATEGORY_CLASS.get(category(chr(o)), 0)
+                        for o in range(0x10000))
+# The same table as a string, to be used by str.translate()
+CLASS_CHARS = CLASS_TABLE.decode('latin-1')
+
+
+def charClass(c):
+    '''Returns the class of a single character'''
+    o = ord(c)
+    if o < 0x10000:
+        return CLASS_TABLE[o]
+    return CATEGORY_CLASS.get(category(c), 0)
+
+
+def classes(w):
+    '''Returns the classes of all characters of w as bytes'''
+    try:
+        return w.translate(CLASS_CHARS).encode('latin-1')
+    except UnicodeEncodeError:
+        # str.translate() leaves characters above the BMP untouched
+        return bytes(charClass(c) for c in w)
+
+
+class ClassFilter(dict):
+    '''Table for str.translate() that deletes every character
+    for which keep(class) is false. The table is filled from
+    CLASS_TABLE (or category()) on first use of a character.
+    '''
+    def __init__(self, keep):
+        super().__init__()
+        self.keep = keep
+
+    def __missing__(self, o):
+        res = o if self.keep(charClass(chr(o))) else None
+        self[o] = res
+        return res
+
+
+LETTER_FILTER = ClassFilter(lambda k: k & LETTER)
+NON_DIA_FILTER = ClassFilter(lambda k: not k & DIA)
+
 
 def rsplitPunc(word, norm=udnorm, clean=False):
     '''This function splits off punctuation 
@@ -33,15 +95,16 @@ def rsplitPunc(word, norm=udnorm, clean=False):
     returns (word, punc)
     '''
     w = normalize(norm, word)
+    cls = classes(w)
     afterWord = len(w)
     for i in range(len(w) - 1, -1, -1):
-        if category(w[i]) not in letter_dia:
+        if not cls[i] & LETTER_DIA:
             afterWord = i
         else:
             break
     if clean:
-        return (''.join(c for c in w[0:afterWord]
-                        if category(c) in letter_dia), w[afterWord:])
+        return (''.join(c for c, k in zip(w[0:afterWord], cls)
+                        if k & LETTER_DIA), w[afterWord:])
     else:
         return (w[0:afterWord], w[afterWord:])
 
@@ -53,16 +116,17 @@ def lsplitPunc(word, norm=udnorm, clean=False):
     returns (punc, word)
     '''
     w = normalize(norm, word)
+    cls = classes(w)
     beforeWord = -1
     for i in range(len(w)):
-        if category(w[i]) not in letter_dia:
+        if not cls[i] & LETTER_DIA:
             beforeWord = i
         else:
             beforeWord += 1
             break
     if clean:
-        return (w[0:beforeWord], ''.join(c for c in w[beforeWord:]
-                                         if category(c) in letter_dia))
+        return (w[0:beforeWord], ''.join(c for c, k in zip(w[beforeWord:], cls[beforeWord:])
+                                         if k & LETTER_DIA))
     else:
         return (w[0:beforeWord], w[beforeWord:])
 
@@ -89,6 +153,8 @@ def splitPunc(words, norm=udnorm, clean=False,
     splitters=['character', 'character', ...]
     non_splitters=['character', 'character', ...]
 
+    NB the words after the first word are normalized according to
+    the module's udnorm. The string is walked only once.
 
     returns ((pre, word, after), (pre, word, after), ...)
     '''
@@ -97,27 +163,52 @@ def splitPunc(words, norm=udnorm, clean=False,
     if non_splitters is None:
         non_splitters = ()
     w = normalize(norm, words)
-    pP = 0
-    for i in range(len(w)):
-        if category(w[i]) in space and pP > 0:
+    cls = classes(w)
+    renorm = norm != udnorm
+    result = []
+    s = 0       # start of the current word in w
+    while True:
+        if result and renorm:
+            w, s, renorm = normalize(udnorm, w[s:]), 0, False
+            cls = classes(w)
+        token, sNext = splitPuncStep(w, cls, s, clean=clean, splitters=splitters,
+                                     non_splitters=non_splitters)
+        result.append(token)
+        if sNext >= len(w):
+            break
+        if sNext == s:
+            raise ValueError(f'splitPunc cannot proceed at {w[s:]!r}; '
+                             'letters should not be defined as non_splitters')
+        s = sNext
+    return tuple(result)
+
+
+def splitPuncStep(w, cls, s, clean=False, splitters=(), non_splitters=()):
+    '''splitPuncStep splits off the first word of w[s:]
+    (see splitPunc); cls are the classes of w.
+
+    returns ((pre, word, after), start of the next word)
+    '''
+    n = len(w)
+    pP = s
+    for i in range(s, n):
+        if cls[i] & SPACE and pP > s:
             pP += 1
-            preWord = w[0:pP].strip('\n')
+            preWord = w[s:pP].strip('\n')
             if preWord:
-                rest = splitPunc(w[pP:], clean=clean, splitters=splitters,
-                                 non_splitters=non_splitters) if pP < len(w) else ()
-                return ((preWord, '', ''),) + rest
+                return (preWord, '', ''), pP
             else:
                 continue
-        elif category(w[i]) not in letter_dia:
+        elif not cls[i] & LETTER_DIA:
             pP += 1
         else:
             break
-    preWord = w[0:pP].strip('\n') if pP else ''
+    preWord = w[s:pP].strip('\n') if pP > s else ''
     pW = pP
-    for i in range(pP, len(w)):
+    for i in range(pP, n):
         if w[i] in non_splitters:
             break
-        elif category(w[i]) in letter_dia:
+        elif cls[i] & LETTER_DIA:
             pW += 1
         else:
             break
@@ -126,58 +217,158 @@ def splitPunc(words, norm=udnorm, clean=False,
     nsplit = False
     spaceBreak = False
     sLoc = None
-    for i in range(pW, len(w)):
+    for i in range(pW, n):
         if clean:
             if spaceBreak:
-                if not category(w[i]) in letter_dia:
+                if not cls[i] & LETTER_DIA:
                     pA += 1
-                    if category(w[i]) in space:
+                    if cls[i] & SPACE:
                         sLoc = pA
                 else:
                     break
-            elif category(w[i]) in space:
+            elif cls[i] & SPACE:
                 pA += 1
                 spaceBreak = True
                 sLoc = pA
             elif w[i] in splitters:
                 pA += 1
                 break
-            elif category(w[i]) in letter_dia:
+            elif cls[i] & LETTER_DIA:
                 pW = i + 1
                 pA = pW
                 word += w[i]
-            elif category(w[i]) not in letter_dia:
+            elif not cls[i] & LETTER_DIA:
                 pA += 1
         else:
             if spaceBreak:
-                if not category(w[i]) in letter_dia:
+                if not cls[i] & LETTER_DIA:
                     pA += 1
-                    if category(w[i]) in space:
+                    if cls[i] & SPACE:
                         sLoc = pA
                 else:
                     break
-            elif category(w[i]) in space:
+            elif cls[i] & SPACE:
                 pA += 1
                 spaceBreak = True
                 sLoc = pA
             elif w[i] in non_splitters:
                 nsplit = True
                 continue
-            elif category(w[i]) not in letter_dia:
+            elif not cls[i] & LETTER_DIA:
                 nsplit = False
                 pA += 1
-            elif category(w[i]) in letter_dia and nsplit == True:
+            elif cls[i] & LETTER_DIA and nsplit == True:
                 pW = i + 1
                 pA = pW
                 word += w[i]
             else:
                 break
-    if not sLoc:
+    if sLoc is None:
         sLoc = pA
-    afterWord = w[pW:sLoc].strip('\n')
-    rest = splitPunc(w[sLoc:], clean=clean, splitters=splitters,
-                     non_splitters=non_splitters) if sLoc < len(w) else ()
-    return ((preWord, word, afterWord),) + rest
+    return (preWord, word, w[pW:sLoc].strip('\n')), sLoc
+
+
+# Text nodes from this length on are tokenized faster by splitPuncArray
+# than by splitPunc. The number is the crossover measured by
+# benchTokenizerBackends in benchmarks.py: from 1000 characters on the
+# numpy backend was faster in every run (1.05-1.9x), while at 500 it
+# ranged from 0.80x to 1.2x, so that shorter nodes stay with splitPunc
+NUMPY_MIN_LEN = 1000
+
+
+def nextIndex(mask):
+    '''Returns for every position i of the boolean array mask
+    the first position >= i where mask is True, or len(mask);
+    the list has an extra item for position len(mask).
+    '''
+    n = len(mask)
+    index = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(index[::-1])[::-1], n).tolist()
+
+
+def splitPuncArray(words, norm=udnorm, clean=False,
+                   splitters=None, non_splitters=None):
+    '''splitPuncArray is a NumPy backend of splitPunc
+    for long strings that returns exactly the same tuples.
+
+    The normalized string is turned into an array of codepoints
+    that is classified with CLASS_TABLE. The positions of letters,
+    spaces and non_splitters are then found by vectorized operations,
+    so that every word is split by a few index lookups instead of
+    a loop over its characters. Words with a non_splitter before
+    their first space are split by splitPuncStep.
+
+    NB clean=True, and non_splitters that are letters, are handled
+    by splitPunc itself.
+
+    returns ((pre, word, after), (pre, word, after), ...)
+    '''
+    if np is None:
+        raise ImportError('splitPuncArray requires numpy')
+    if splitters is None:
+        splitters = ()
+    if non_splitters is None:
+        non_splitters = ()
+    nsChars = set(non_splitters) if isinstance(non_splitters, str) \
+        else {c for c in non_splitters if len(c) == 1}
+    if clean or any(charClass(c) & LETTER_DIA for c in nsChars):
+        return splitPunc(words, norm=norm, clean=clean,
+                         splitters=splitters, non_splitters=non_splitters)
+    w = normalize(norm, words)
+    if not w:
+        return (('', '', ''),)
+    result = []
+    s = 0
+    if norm != udnorm:
+        # Like splitPunc, the words after the first one are normalized by udnorm
+        token, s = splitPuncStep(w, classes(w), 0, non_splitters=non_splitters)
+        result.append(token)
+        if s >= len(w):
+            return tuple(result)
+        w, s = normalize(udnorm, w[s:]), 0
+    n = len(w)
+
+    codepoints = np.frombuffer(w.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+    cls = np.frombuffer(CLASS_TABLE, dtype=np.uint8)[np.minimum(codepoints, 0xFFFF)]
+    above = np.flatnonzero(codepoints > 0xFFFF)
+    if len(above):
+        cls[above] = [charClass(w[i]) for i in above]
+    isLetter = (cls & LETTER_DIA) > 0
+    isSpace = (cls & SPACE) > 0
+    isNonSplitter = np.isin(codepoints, [ord(c) for c in nsChars])
+
+    nextLetter = nextIndex(isLetter)
+    nextBreak = nextIndex(~isLetter | isNonSplitter)
+    nextSpace = nextIndex(isSpace)
+    nextNonSplitter = nextIndex(isNonSplitter)
+    lastSpace = np.maximum.accumulate(np.where(isSpace, np.arange(n), -1)).tolist()
+
+    classList = None    # Classes for splitPuncStep, only if needed
+    while True:
+        pP = nextLetter[s]
+        sp = nextSpace[s + 1]
+        if sp < pP:
+            # A space in the punctuation before the word
+            token, sNext = (w[s:sp + 1].strip('\n'), '', ''), sp + 1
+        else:
+            pW = nextBreak[pP]
+            nextWord = nextLetter[pW]
+            sp = nextSpace[pW]
+            if nextNonSplitter[pW] < (sp if sp < nextWord else nextWord):
+                if classList is None:
+                    classList = cls.tobytes()
+                token, sNext = splitPuncStep(w, classList, s, non_splitters=non_splitters)
+            else:
+                sLoc = lastSpace[nextWord - 1] + 1 if sp < nextWord else nextWord
+                token, sNext = (w[s:pP].strip('\n'), w[pP:pW], w[pW:sLoc].strip('\n')), sLoc
+        result.append(token)
+        if sNext >= n:
+            break
+        if sNext == s:
+            raise ValueError(f'splitPunc cannot proceed at {w[s:]!r}; '
+                             'letters should not be defined as non_splitters')
+        s = sNext
+    return tuple(result)
 
 
 def cleanWords(words, norm=udnorm, clean=False,
@@ -197,6 +388,9 @@ def cleanWords(words, norm=udnorm, clean=False,
         are glued together without punctuation
         exceptions can be defined in splitters
 
+    NB the words after the first word are normalized according to
+    the module's udnorm. The string is walked only once.
+
     returns: ('string', 'string', ...)
     """
     if splitters is None:
@@ -204,50 +398,62 @@ def cleanWords(words, norm=udnorm, clean=False,
     if non_splitters is None:
         non_splitters = ()
     w = normalize(norm, words)
-    pP = 0
-    for i in range(len(w)):
-        if category(w[i]) not in letter_dia:
-            pP += 1
-        else:
-            break
-    pW = pP
-    for i in range(pP, len(w)):
-        if category(w[i]) in letter_dia:
-            pW += 1
-        else:
-            break
-    realWord = w[pP:pW]
-    pA = pW
-    nsplit = False
-    for i in range(pW, len(w)):
-        if clean:
-            if category(w[i]) in space:
-                break
-            elif w[i] in splitters:
+    cls = classes(w)
+    renorm = norm != udnorm
+    res = []
+    s = 0       # start of the current word in w
+    while True:
+        if res and renorm:
+            w, s, renorm = normalize(udnorm, w[s:]), 0, False
+            cls = classes(w)
+        n = len(w)
+        pP = s
+        for i in range(s, n):
+            if not cls[i] & LETTER_DIA:
+                pP += 1
+            else:
                 break
-            elif category(w[i]) not in letter_dia:
-                pA += 1
-            elif category(w[i]) in letter_dia:
-                realWord += w[i]
-                pA += 1
-        else:
-            if w[i] in non_splitters:
-                nsplit = True
-                continue
-            elif category(w[i]) in letter_dia and nsplit == True:
-                pW = i + 1
-                pA = pW
-                realWord += w[i]
-            elif category(w[i]) not in letter_dia:
-                nsplit = False
-                pA += 1
+        pW = pP
+        for i in range(pP, n):
+            if cls[i] & LETTER_DIA:
+                pW += 1
             else:
                 break
-    res = (realWord,) + \
-          (cleanWords(w[pA:], norm=udnorm, clean=clean,
-                      splitters=splitters, non_splitters=non_splitters)
-           if pA < len(w) else ())
-    return res if not res == ('',) else ()
+        realWord = w[pP:pW]
+        pA = pW
+        nsplit = False
+        for i in range(pW, n):
+            if clean:
+                if cls[i] & SPACE:
+                    break
+                elif w[i] in splitters:
+                    break
+                elif not cls[i] & LETTER_DIA:
+                    pA += 1
+                elif cls[i] & LETTER_DIA:
+                    realWord += w[i]
+                    pA += 1
+            else:
+                if w[i] in non_splitters:
+                    nsplit = True
+                    continue
+                elif cls[i] & LETTER_DIA and nsplit == True:
+                    pW = i + 1
+                    pA = pW
+                    realWord += w[i]
+                elif not cls[i] & LETTER_DIA:
+                    nsplit = False
+                    pA += 1
+                else:
+                    break
+        res.append(realWord)
+        if pA >= n:
+            break
+        s = pA
+    # Empty strings at the end are left out
+    while res and res[-1] == '':
+        res.pop()
+    return tuple(res)
 
 
 def tokenizer(sentence, norm=udnorm, punc=False, clean=False,
@@ -287,33 +493,28 @@ def tokenizer(sentence, norm=udnorm, punc=False, clean=False,
 
 
 def stripAccents(word):
-    return ''.join(c for c in normalize('NFD', word.lower())
-                   if category(c) in letter)
+    return normalize('NFD', word.lower()).translate(LETTER_FILTER)
 
 # Conversions of full sentences with spaces
 
 
 def plainMajuscule(tokens):
-    return ''.join(c.upper() for c in
-                   normalize('NFD', ' '.join(tokens))
-                   if category(c) not in dia)
+    return normalize('NFD', ' '.join(tokens)).translate(NON_DIA_FILTER).upper()
 
 
+# NB str.lower() lowercases a capital sigma at the end of a word into
+# a final sigma; replacing it first (here and in plainLow) keeps the
+# result identical to lowercasing the characters one by one.
 def plainMinuscule(tokens):
-    return ''.join(c.lower() for c in
-                   normalize('NFD', ' '.join(tokens))
-                   if category(c) not in dia)
+    return normalize('NFD', ' '.join(tokens)).translate(NON_DIA_FILTER) \
+                                              .replace('Σ', 'σ').lower()
 
 # Conversions of single word strings
 
 
 def plainCaps(word):
-    return ''.join(c.upper() for c in
-                   normalize('NFD', word)
-                   if category(c) in letter)
+    return normalize('NFD', word).translate(LETTER_FILTER).upper()
 
 
 def plainLow(word):
-    return ''.join(c.lower() for c in
-                   normalize('NFD', word)
-                   if category(c) in letter)
+    return normalize('NFD', word).translate(LETTER_FILTER).replace('Σ', 'σ').lower()
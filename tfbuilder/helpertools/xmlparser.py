@@ -1,10 +1,10 @@
 import re
 import operator
 from pprint import pprint
-from collections import OrderedDict
 from data.attrib_errors import error_dict
 from ordered_set import OrderedSet
 from tf_config import langsettings
+from helpertools.cache import LRUCache
 
 # XML RE PATTERNS
 commentFullRE   = re.compile(r'^<!--.*?-->$')
@@ -18,19 +18,93 @@ closedAttrTagRE = re.compile(r'<.+?=.+?/ *?>')
 bodyStartRE     = re.compile(r'<body *.*?>')
 bodyStopRE      = re.compile(r'</body *.*?>')
 xmlMetaRE       = re.compile(r'<\?.+\?>')
+attribSpaceRE   = re.compile(r'\s*=\s*"\s*')
+attribValueRE   = re.compile(r'"([^"]*)"')
 
 
-def xmlSplitter(xmlfile):
-    '''The xmlReader reads a XML file completely into memory,
-    while splitting the text on "<" and ">" into a list.
-    '''        
+xmlSplitRE      = re.compile(r'[<>]')
+
+
+def joinedLines(xml, chunk_size=65536):
+    '''joinedLines reads an opened XML file in chunks of
+    chunk_size characters and yields the text as if all lines
+    had been joined into one string:
+    - every line is strip()ped of whitespace
+    - a line ending with "-" (hyphenation) is glued to the next line
+    - any other line is joined to the next line with a space
+
+    Only the whitespace at the end of the current line is kept
+    in memory, so the memory use does not depend on the file size.
+    '''
+    lineStart = True    # No content has been found on the current line yet
+    lineOpen  = False   # Characters have been read since the last newline
+    lastChar  = ''      # Last non-whitespace character of the current line
+    trailing  = ''      # Whitespace that can only be emitted if content follows
+
+    def piece(part):
+        nonlocal lineStart, lastChar, trailing
+        if lineStart:
+            part = part.lstrip()
+            if not part:
+                return ''
+            lineStart = False
+        content = part.rstrip()
+        if not content:
+            trailing += part
+            return ''
+        res = trailing + content
+        trailing = part[len(content):]
+        lastChar = content[-1]
+        return res
+
+    def lineEnd():
+        nonlocal lineStart, lineOpen, lastChar, trailing
+        res = '' if lastChar == '-' else ' '
+        lineStart, lineOpen, lastChar, trailing = True, False, '', ''
+        return res
+
+    while True:
+        chunk = xml.read(chunk_size)
+        if not chunk:
+            break
+        *lines, rest = chunk.split('\n')
+        out = []
+        for line in lines:
+            out.append(piece(line))
+            out.append(lineEnd())
+        if rest:
+            lineOpen = True
+            out.append(piece(rest))
+        yield ''.join(out)
+    if lineOpen:
+        yield lineEnd()
+
+
+def xmlSplitter(xmlfile, chunk_size=65536):
+    '''The xmlSplitter reads a XML file in chunks,
+    while splitting the text on "<" and ">".
+    It yields the tags and the text in between
+    one at a time (the text between two adjacent
+    tags is yielded as an empty string).
+
+    Lines are joined according to joinedLines().
+    '''
     with open(xmlfile) as xml:
-        data = ''.join([(line.strip() + ' ' if not line.strip().endswith('-') else line.strip()) \
-                        for line in xml.readlines()])\
-                 .replace('<', '#!#<')\
-                 .replace('>', '>#!#')\
-                 .split('#!#')
-    return data
+        buf = ''
+        pos = 0     # Position in buf from which "<" and ">" are searched
+        for chunk in joinedLines(xml, chunk_size=chunk_size):
+            buf += chunk
+            start = 0
+            for m in xmlSplitRE.finditer(buf, pos):
+                if m.group() == '<':
+                    yield buf[start:m.start()]
+                    start = m.start()
+                else:
+                    yield buf[start:m.end()]
+                    start = m.end()
+            buf = buf[start:]
+            pos = len(buf)
+        yield buf
 
 
 def attribClean(elem, errors, lang='generic', **kwargs):
@@ -47,16 +121,14 @@ def attribClean(elem, errors, lang='generic', **kwargs):
     '''
 #     print(elem)
     elem = elem.strip('<>\/ ')
-    elem = re.sub(r'\s*=\s*"\s*', '="', elem)
+    elem = attribSpaceRE.sub('="', elem)
     tag = ''.join([c for c in elem[:elem.find(' ')] if not c.isdigit()])
     
     try:
-        attribs = {k.strip(): v.strip('" ') for k, v in [elem.split('="') \
-                          for elem in elem[elem.find(' '):].split('" ')]}
+        attribs = attribSplit(elem)
     except ValueError:
         elem = elem.replace("'", '"')
-        attribs = {k.strip(): v.strip('" ') for k, v in [elem.split('="') \
-                          for elem in elem[elem.find(' '):].split('" ')]}
+        attribs = attribSplit(elem)
     if lang in errors:
         attribs = {k: (errors[lang][v] \
                        if v in errors[lang] else v) \
@@ -67,9 +139,135 @@ def attribClean(elem, errors, lang='generic', **kwargs):
     return tag_name, attribs
 
 
+def attribSplit(elem):
+    '''Splits a normalized tag (see attribClean) into a dict
+    of attributes; raises a ValueError if it cannot be split.
+    '''
+    return {k.strip(): v.strip('" ') for k, v in [elem.split('="') \
+                   for elem in elem[elem.find(' '):].split('" ')]}
+
+
+class AttribCache(LRUCache):
+    '''AttribCache is a bounded LRU cache of tag templates
+    used by attribCleanCached. A template is a tag with the
+    values of its attributes left out, e.g.:
+        <milestone unit="" n=""/>
+    For every template, the outcome of the normalization and the
+    error correction of attribClean is stored as a plan:
+        (tag_name, ((key, value_index), ...))
+    so that for a repeated shape only the values need to be
+    extracted and corrected. Templates that cannot be planned
+    (e.g. single quotes or "=" inside values) are stored as None,
+    and are processed by attribClean itself.
+    '''
+
+
+attribCache = AttribCache()
+
+
+def attribPlan(parts, errors, lang='generic', **kwargs):
+    '''Creates the plan of a tag template (see AttribCache)
+    by normalizing the template with numbered placeholders
+    instead of the values. Returns None if attribClean would
+    treat the values in any other way than:
+        value.lstrip().strip(' ') + error correction
+    '''
+    placeholders = [f'\x00{i}\x00' for i in range(len(parts) // 2)]
+    elem = ''.join(part if i % 2 == 0 else f'"{placeholders[i // 2]}"'
+                   for i, part in enumerate(parts))
+    elem = elem.strip('<>\/ ')
+    elem = attribSpaceRE.sub('="', elem)
+    tag = ''.join([c for c in elem[:elem.find(' ')] if not c.isdigit()])
+    if '"' in tag or '\x00' in tag:
+        return None
+    try:
+        attribs = attribSplit(elem)
+    except ValueError:
+        return None
+    index = {p: i for i, p in enumerate(placeholders)}
+    if not all(v in index and not '\x00' in k for k, v in attribs.items()):
+        return None
+    tag_name = (tag, tuple(key for key in attribs.keys() if not key in kwargs[lang]['ignore_attrib_keys']))
+    return tag_name, tuple((k, index[v]) for k, v in attribs.items())
+
+
+def attribCleanCached(elem, errors, lang='generic', cache=attribCache, **kwargs):
+    '''attribCleanCached returns the same as attribClean, but it
+    looks up the template of the tag in the cache (see AttribCache)
+    first; for a known template only the values are extracted.
+    '''
+    parts = attribValueRE.split(elem)
+    values = parts[1::2]
+    joined = ''.join(values)
+    if '=' in joined or '\x00' in joined:
+        return attribClean(elem, errors, lang=lang, **kwargs)
+    key = (lang, tuple(parts[::2]))
+    found, plan = cache.get(key)
+    if not found:
+        plan = attribPlan(parts, errors, lang=lang, **kwargs)
+        cache.put(key, plan)
+    if plan is None:
+        return attribClean(elem, errors, lang=lang, **kwargs)
+    tag_name, keys = plan
+    corrections = errors[lang] if lang in errors else {}
+    attribs = {}
+    for k, i in keys:
+        v = values[i].lstrip().strip(' ')
+        attribs[k] = corrections[v] if v in corrections else v
+    return tag_name, attribs
+
+
+def tagLexer(elem):
+    '''tagLexer classifies an element that starts with "<".
+    It dispatches on the first characters of the element and
+    scans it only once, instead of trying all the XML RE PATTERNS
+    above in turn. The resulting code is the same as the code
+    of the first pattern in the cascade that would match:
+
+    'commentFull', 'commentStart', 'bodyStart', 'bodyStop',
+    'xmlMeta', 'openTag', 'closeTag', 'openCloseTag',
+    'openAttrTag', 'closedAttrTag' or 'text'
+
+    NB elem is expected to be produced by xmlSplitter,
+    so it does not contain newlines.
+    '''
+    second = elem[1:2]
+    if second == '!' and elem.startswith('<!--'):
+        if len(elem) >= 7 and elem.endswith('-->'):
+            return 'commentFull'
+        return 'commentStart'
+    if not elem.endswith('>'):
+        return 'text'
+    if second == 'b' and elem.startswith('<body'):
+        return 'bodyStart'
+    if second == '/':
+        if elem.startswith('</body'):
+            return 'bodyStop'
+        return 'closeTag' if len(elem) >= 4 else 'text'
+    if second == '?' and len(elem) >= 5 and elem.endswith('?>'):
+        return 'xmlMeta'
+    inner = elem[1:-1]
+    if not inner:
+        return 'text'
+    if '=' not in inner:
+        if '/' not in inner:
+            return 'openTag'
+        stripped = inner.rstrip(' ')
+        if stripped.endswith('/') and len(stripped) >= 2 \
+                and '/' not in stripped[:-1]:
+            return 'openCloseTag'
+        return 'text'
+    if inner[-1] != '/':
+        return 'openAttrTag' if '=' in inner[1:-2] else 'text'
+    stripped = inner.rstrip(' ')
+    if stripped.endswith('/') and '=' in stripped[1:-2]:
+        return 'closedAttrTag'
+    return 'text'
+
+
 def dataParser(data, lang='generic'):
-    '''The xmlParser is able to parse the elements
-    created by xmlSplitter(xmlfile). It returns a tuple
+    '''The dataParser is able to parse the elements
+    created by xmlSplitter(xmlfile). It yields a tuple
     containing the type and normalized element: (type, elem)
     
     Normalization of element involves:
@@ -78,52 +276,78 @@ def dataParser(data, lang='generic'):
         <name attrib1="attribname1" attrib2="attribname2 etc="etc">
     - correction of mistakes in attributes defined in kwargs[lang]
       (see attribClean)
+
+    Text is recognized by its first character; tags are
+    classified by tagLexer.
     '''
-    parsed_data = []
-    comment     = False
+    comment = False
     
     for elem in data:
         if comment:
-            if commentStopRE.fullmatch(elem):
+            if elem.endswith('-->'):
                 comment = False
             code, content = 'comment', ''
+        elif not elem.startswith('<'):
+            if elem.strip() == '':
+                code, content = None, elem
+            else:
+                code, content = 'text', elem
         else:
-            if commentFullRE.fullmatch(elem):
-                code, content = 'comment', ''
-            elif commentStartRE.fullmatch(elem):
+            code = tagLexer(elem)
+            if code == 'text':
+                content = elem
+            elif code == 'openTag':
+                content = elem.strip('<> ')
+            elif code == 'closeTag':
+                content = elem.strip('<>/ ')
+            elif code == 'openCloseTag':
+                content = elem.strip('<>/ ')
+            elif code in ('openAttrTag', 'closedAttrTag'):
+                content = attribCleanCached(elem, error_dict, lang=lang, **langsettings)
+            elif code == 'commentStart':
                 comment = True
                 code, content = 'comment', ''
-            elif bodyStartRE.fullmatch(elem):
-                code, content = 'bodyStart', ''
-            elif bodyStopRE.fullmatch(elem):
-                code, content = 'bodyStop', ''
-            elif xmlMetaRE.fullmatch(elem):
+            elif code in ('commentFull', 'xmlMeta'):
                 code, content = 'comment', ''
-            elif openTagRE.fullmatch(elem):
-                code, content = 'openTag', elem.strip('<> ')
-            elif closeTagRE.fullmatch(elem):
-                code, content = 'closeTag', elem.strip('<>/ ')
-            elif opencloseTagRE.fullmatch(elem):
-                code, content = 'openCloseTag', elem.strip('<>/ ')
-            elif openAttrTagRE.fullmatch(elem):
-                code = 'openAttrTag'
-                content = attribClean(elem, error_dict, lang=lang, **langsettings)
-            elif closedAttrTagRE.fullmatch(elem):
-                code = 'closedAttrTag'
-                content = attribClean(elem, error_dict, lang=lang, **langsettings)
-            elif elem.strip() == '':
-                code, content = None, elem
             else:
-                code, content = 'text', elem
-        parsed_data.append((code, content))
-    return parsed_data
+                content = ''
+        yield code, content
+
+
+def bodyAttribEvents(data, lang='generic'):
+    '''bodyAttribEvents is the attribute-only prepass over the elements
+    produced by xmlSplitter, for attribsAnalysis. It yields the same
+    'openAttrTag' and 'closedAttrTag' events as dataParser would yield
+    for the body (after 'bodyStart'), and nothing else. The other elements
+    are skipped before they are parsed: text is not looked at, and in the
+    body only the tags with an "=" (and comments) are classified by
+    tagLexer.
+    '''
+    comment = False
+    body = False
+    for elem in data:
+        if comment:
+            if elem.endswith('-->'):
+                comment = False
+            continue
+        if not elem.startswith('<') or (body and '=' not in elem and elem[1:2] != '!'):
+            continue
+        code = tagLexer(elem)
+        if code == 'commentStart':
+            comment = True
+        elif not body:
+            body = code == 'bodyStart'
+        elif code in ('openAttrTag', 'closedAttrTag'):
+            yield code, attribCleanCached(elem, error_dict, lang=lang, **langsettings)
         
-    
+
 def metadataReader(data, lang='generic', **kwargs):
     """The **kwargs are the 'metadata' field in tf_config.py
     the **kwargs passed should be langsettings[lang]['xmlmetadata'] from tf_config.py
     
-    data should be produced by dataParser
+    data should be produced by dataParser; if data is an iterator,
+    it is consumed up to and including 'bodyStart', so that the
+    remaining events of data are the events of the body.
     """
     metadata   = {}
     body_index = False
@@ -133,9 +357,9 @@ def metadataReader(data, lang='generic', **kwargs):
     TEMP       = [None, None]
     DELIM      = ''
     tagList    = []
-    for code, content in data:
+    for index, (code, content) in enumerate(data):
         if code == 'bodyStart':
-            body_index = data.index((code, content)) + 1
+            body_index = index + 1
             break
         elif code == 'text':
             content = content.strip('. ')
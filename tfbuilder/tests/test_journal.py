@@ -0,0 +1,32 @@
+# Tests of the hash of the settings in the run journal
+#
+# A setting that changes the output must change the hash, and
+# a setting that does not (or the same setting in another
+# order) must leave it as it is.
+#
+# Run from the tfbuilder directory with:
+#   python -m pytest tests
+
+import sys
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from helpertools.journal import configHash, indexFingerprint
+
+lemmas = {'λόγος': ('λόγος',), 'λόγου': ('λόγος',), 'ἦν': ('εἰμί',)}
+options = {'version': '1.0'}
+
+
+def test_dict_lemmatizer_is_fingerprinted_by_its_content():
+    edited = {**lemmas, 'ἦν': ('εἰμί', 'ἤν')}
+    assert indexFingerprint(lemmas) == indexFingerprint(dict(reversed(lemmas.items())))
+    assert indexFingerprint(lemmas) != indexFingerprint(edited)
+    assert configHash({'lemmatizer': lemmas}, options) != configHash({'lemmatizer': edited}, options)
+
+
+def test_neutral_settings_are_left_out():
+    settings = {'lemmatizer': lemmas, 'sentence_delimit': '.;'}
+    assert configHash(settings, options) == \
+        configHash({**settings, 'token_cache_bytes': 2**20, 'lemma_cache_size': 10}, options)
+    assert configHash(settings, options) != configHash({**settings, 'sentence_delimit': '.'}, options)
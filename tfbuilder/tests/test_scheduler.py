@@ -0,0 +1,100 @@
+# Tests of the supervision of the workers of runWorkers
+#
+# Whatever happens to a worker (it dies, it exceeds its time or memory
+# budget, or it exits right after its last file), every file is
+# reported exactly once, and the run goes on.
+#
+# Run from the tfbuilder directory with:
+#   python -m pytest tests
+
+import os
+import sys
+import time
+import threading
+from os import path
+from multiprocessing import get_context
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from helpertools.scheduler import runWorkers
+
+# The memory kept by a worker (see work())
+kept = []
+
+
+def work(file):
+    '''Works on a toy file (kind, argument):
+        ('sleep', seconds), ('crash', exit code), ('grow', MB)
+    or ('exit', seconds): the worker exits that long after the file
+    '''
+    kind, arg = file
+    if kind == 'sleep':
+        time.sleep(arg)
+    elif kind == 'crash':
+        os._exit(arg)
+    elif kind == 'grow':
+        block = bytearray(arg * 2**20)
+        block[::4096] = b'x' * len(block[::4096])
+        kept.append(block)
+        time.sleep(1)
+    elif kind == 'exit':
+        threading.Timer(arg, os._exit, (0,)).start()
+    return 'done', file
+
+
+def failed(file, seconds, rss, reason):
+    return 'failed', file, reason
+
+
+def slowStart(seconds):
+    time.sleep(seconds)
+
+
+def run(files, workers=2, pause=0, **kwargs):
+    '''Returns {file: status} of runWorkers, after checking that
+    every file has been reported exactly once; the consumer waits
+    pause seconds after every result
+    '''
+    results = []
+    for result in runWorkers(work, files, workers, failed=failed, poll=0.05,
+                             context=get_context('fork'), **kwargs):
+        results.append(result)
+        time.sleep(pause)
+    reported = [result[1] for result in results]
+    assert sorted(reported) == sorted(files)
+    return {result[1]: result[0] for result in results}
+
+
+def test_dying_worker():
+    files = [('sleep', 0.1), ('crash', 3), ('sleep', 0.2), ('crash', 4), ('sleep', 0.3)]
+    statuses = run(files)
+    assert statuses == {file: 'failed' if file[0] == 'crash' else 'done' for file in files}
+
+
+def test_worker_exits_after_its_last_file():
+    # Every worker gets one file, and has exited before it is stopped
+    files = [('exit', 0.05), ('exit', 0.1)]
+    assert set(run(files, pause=0.5).values()) == {'done'}
+
+
+def test_recycled_workers():
+    files = [('sleep', i / 100) for i in range(12)]
+    assert set(run(files, recycle_after=1).values()) == {'done'}
+
+
+def test_timing_out_worker():
+    files = [('sleep', 5), ('sleep', 0.1), ('sleep', 0.2), ('sleep', 0.3)]
+    statuses = run(files, file_timeout=1)
+    assert statuses == {file: 'failed' if file[1] == 5 else 'done' for file in files}
+
+
+def test_timeout_excludes_initializer():
+    files = [('sleep', 0.1), ('sleep', 0.2), ('sleep', 0.3)]
+    statuses = run(files, file_timeout=0.5, initializer=slowStart, initargs=(1,), recycle_after=1)
+    assert set(statuses.values()) == {'done'}
+
+
+def test_growing_worker():
+    files = [('grow', 200), ('grow', 20), ('sleep', 0), ('grow', 20)]
+    statuses = run(files, file_rss=100 * 2**20)
+    assert statuses == {file: 'failed' if file[1] == 200 else 'done' for file in files}
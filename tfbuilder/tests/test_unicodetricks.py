@@ -0,0 +1,53 @@
+# Property tests of the tokenizer of unicodetricks
+#
+# splitPunc and cleanWords walk the string only once; they replaced
+# recursive implementations, that are kept in helpertools/benchmarks.py
+# as a reference. For any string and any settings, the new functions
+# return exactly the same as their predecessors, or raise the same
+# exception.
+#
+# Run from the tfbuilder directory with:
+#   python -m pytest tests
+
+import sys
+from os import path
+
+import pytest
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from helpertools.unicodetricks import splitPunc, cleanWords
+from helpertools.benchmarks import recursiveSplitPunc, recursiveCleanWords
+
+# Characters that matter to the tokenizer: Greek letters (precomposed and
+# with combining diacritics), Latin letters, digits, whitespace and
+# punctuation, including elision signs
+TOKENIZER_CHARS = list('αβγεσςκe1 .,-<·᾽\'’()[') + \
+                  ['ά', 'ἐ', 'ῶ', 'ὶ', 'ϊ', 'ΐ', 'é', '\u0301', '\u0313', '\u0345', '\u0344',
+                   '\n', '\u00a0']
+
+# The recursive functions recurse once per word, so that the strings are kept short
+texts = st.text(st.one_of(st.sampled_from(TOKENIZER_CHARS), st.characters()), max_size=30)
+
+
+def outcome(func, *args, **kwargs):
+    '''Returns the result of func, or the type of its exception'''
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('new, old', [(splitPunc, recursiveSplitPunc),
+                                      (cleanWords, recursiveCleanWords)])
+@settings(max_examples=2000, deadline=None)
+@given(text=texts,
+       norm=st.sampled_from(['NFC', 'NFD']),
+       clean=st.booleans(),
+       splitters=st.sampled_from([None, ('-',), ('.',)]),
+       non_splitters=st.sampled_from([None, ('-',), ('-', '<')]))
+def test_parity(new, old, text, norm, clean, splitters, non_splitters):
+    kwargs = {'norm': norm, 'clean': clean, 'splitters': splitters, 'non_splitters': non_splitters}
+    assert outcome(new, text, **kwargs) == outcome(old, text, **kwargs)
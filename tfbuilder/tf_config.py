@@ -68,20 +68,33 @@ generic = {
     # Package of langtools
     'langtool': langtools.Generic,
     'replace_func': langtools.Generic.replace,
+    # Detect betacode per text node, so that the replace function
+    # can skip the betacode conversion if there is none
+    'detect_betacode': False,
     # Tokenizer
     'tokenizer': langtools.Generic.splitTokenize,
+    # NB backend can be 'python', 'numpy' (requires numpy) or 'auto'
+    # ('auto' uses numpy for long text nodes only)
     'tokenizer_args': {'punc': True,
                        'clean': False,
                        'splitters': None,
-                       'non_splitters': ('-', '<'), },
+                       'non_splitters': ('-', '<'),
+                       'backend': 'python', },
     'token_out': OrderedDict([('pre', {'text': False, 'description': 'interpunction before word'}),
                               ('orig', {
                                   'text': True, 'description': 'the original format of the word without interpunction'}),
                               ('post', {
                                   'text': False, 'description': 'interpunction after word'}),
                               ]),
+    # Supply accents if absent (set by convert())
+    'supply_accents': False,
+    # Memory budget of the cache of the output of recurring tokens
+    # in bytes (per process); 0 switches the token cache off
+    'token_cache_bytes': 256 * 2**20,
     # Lemmatizer
     'slemmatizer': None,
+    # Morphology (only loaded if the 'morph' text format is used)
+    'smorphology': None,
     # Text formats
     'text_formats': {'orig': {'otext_name': 'fmt:text-orig-orig',
                               'format': '{pre}{orig}{post}',
@@ -137,8 +150,24 @@ generic = {
 greek = {**generic,  # Inherit all key-value pairs of 'generic'
          # Replacement and additional settings compared to 'generic'
          'langtool': langtools.Greek,
-         'replace_func': langtools.Greek.replace,
+         'replace_func': langtools.Greek.replaceCached,
+         # Maximum number of tokens of which the replacement is cached
+         'replace_cache_size': 100000,
+         # Maximum number of words of which the normalized form is cached
+         'norm_cache_size': 100000,
+         # Maximum number of words of which the lemmata are cached
+         'lemma_cache_size': 200000,
+         # Maximum number of unaccented words of which the accentuations are cached
+         # (and saved for later runs) if convert() is called with supply_accents=True
+         'accent_cache_size': 200000,
+         # Maximum number of words of which the parse codes are cached
+         'morph_cache_size': 200000,
+         # Maximum edit distance (1 or 2) of the fuzzy lemma fallback, 0 to switch it off;
+         # it requires the fuzzy index (see helpertools/lemmatizer.py)
+         'fuzzy_distance': 0,
+         'detect_betacode': True,
          'slemmatizer': langtools.Greek.startLemmatizer,
+         'smorphology': langtools.Greek.startMorphology,
          'struct_counter_metadata': {'_sentence': f"sentences defined by the following delimiters: {{{'.', ';',}}}",
                                      '_phrase': f"sentences defined by the following delimiters: {{{',', '·', '·', ':',}}}"},
          'text_formats': {'orig': {'otext_name': 'fmt:text-orig-full',
@@ -174,9 +203,17 @@ greek = {**generic,  # Inherit all key-value pairs of 'generic'
 #                           'lemma': {'otext_name': 'fmt:lex-orig-lemma-fulloptions',
 #                                     'format': '{lemma} ',
 #                                     'function': langtools.Greek.lemmaWord,
+#                                     'batch_function': langtools.Greek.lemmaWords,
 #                                     'before_replace': False,
 #                                     'start_lemmatizer': langtools.Greek.startLemmatizer,
 #                                     'description': 'possible lemmata of the original words'},
+#                           NB the morph format requires the morphology index (see helpertools/morphology.py)
+#                           'morph': {'otext_name': 'fmt:lex-orig-morph',
+#                                     'format': '{morph} ',
+#                                     'function': langtools.Greek.morphWord,
+#                                     'batch_function': langtools.Greek.morphWords,
+#                                     'before_replace': False,
+#                                     'description': 'possible Morpheus parse codes of the original words'},
                           },
          # XML settings
          'section_tags': {'div', 'milestone', 'state', },
@@ -1,16 +1,21 @@
 # General imports
 import re
+import sys
 import pickle
 import csv
+import shutil
+import resource
 import betacode.conv
-from os import path
+from os import path, makedirs, getpid
 from glob import glob
 from pprint import pprint
 from itertools import takewhile
 from ordered_set import OrderedSet
 from unicodedata import category, normalize
 from collections import OrderedDict, namedtuple
-from multiprocessing import Pool
+from types import MappingProxyType
+from time import time
+from multiprocessing import cpu_count
 
 # Text Fabric imports
 from tf.fabric import Fabric, Timestamp
@@ -18,13 +23,32 @@ from tf.convert.walker import CV
 
 # Local imports
 from helpertools.unicodetricks import *
-from helpertools.lemmatizer import lemmatize
-from helpertools.xmlparser import xmlSplitter, dataParser, metadataReader, attribsAnalysis
+from helpertools.lemmatizer import lemmatize, shareLemmatizer
+from helpertools.xmlparser import xmlSplitter, dataParser, bodyAttribEvents, metadataReader, attribsAnalysis, attribCache
+from helpertools.cache import LRUCache, statsSummary
+from helpertools.journal import JOURNAL, COMPLETED, fileHash, configHash, appendJournal, readJournal, lastEntries, lastOutputs, \
+    upToDate
+from helpertools.scheduler import loadTimings, saveTimings, estimateCosts, lptOrder, makespanSummary, runWorkers, \
+    processRSS
 from data.tlge_metadata import tlge_metadata
 from data.attrib_errors import error_dict
 from tf_config import langsettings, generic_metadata
 
 
+def tokenSize(key, value):
+    '''Estimates the memory used by an item of tokenCache in bytes'''
+    size = sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+    for token, token_processed in value:
+        size += sys.getsizeof(token) + sys.getsizeof(token_processed) + \
+            sum(sys.getsizeof(v) for v in token_processed.values())
+    return size
+
+
+# Cache of the output of the tokens (see Conversion.process_token());
+# it is cleared by convert(), which sets its budget to token_cache_bytes
+tokenCache = LRUCache(maxsize=sys.maxsize, maxbytes=0, sizeof=tokenSize)
+
+
 class Conversion:
     def __init__(self, data, **kwargs):
         self.data = data                                # Data in preprocessed XML or CSV
@@ -43,8 +67,30 @@ class Conversion:
             {k for k in self.token_out} | \
             {k for k in self.text_formats}
 
+        # Text formats with a 'batch_function' are processed for
+        # all tokens of a text at once (e.g. the lemma format)
+        self.batch_formats = tuple(form for form, sett in self.text_formats.items()
+                                   if 'batch_function' in sett and not sett['before_replace'])
+        # Text formats that require an additional argument,
+        # like the lemmatizer for the lemma format
+        self.format_args = {form: (getattr(self, name, None),)
+                            for form, name in (('lemma', 'lemmatizer'), ('morph', 'morphology'))
+                            if form in self.text_formats}
+        # The text formats are compiled once into the steps that
+        # are run for every token (see formatPlan())
+        self.before_plan = self.formatPlan(before_replace=True)
+        self.after_plan = self.formatPlan(before_replace=False)
+        # The output of recurring tokens is cached within a budget of
+        # token_cache_bytes (see tokenCache); its statistics are kept per conversion
+        self.token_cache = tokenCache if getattr(self, 'token_cache_bytes', 0) else None
+        self.token_cache_stats = (tokenCache.hits, tokenCache.misses, tokenCache.evictions)
+
         # Variables used in processing
         self.res_text = None    # Handle text that ends with non_splitter
+        # Count text nodes and tokens with and without betacode
+        self.betacode_stats = {'nodes': 0, 'tokens': 0, 'beta_nodes': 0, 'beta_tokens': 0}
+        # Count the tokens produced by process_text()
+        self.token_count = 0
 
     def token_features(self, token_out):
         featuresInd = []
@@ -55,6 +101,106 @@ class Conversion:
             self.nonIntFeatures.add(part)
         return tuple(featuresInd)
 
+    def formatPlan(self, before_replace):
+        '''Compiles the text formats that are processed before (or after)
+        the replace function into a tuple of steps, in the order of
+        text_formats:
+            (form, function, args, source, normalized)
+
+        function is None for batch formats, which are assigned after all
+        tokens of a text have been processed. If the format function only
+        transforms the result of another one (see derived_formats of the
+        langtool), function is the transformation and source the other
+        function, of which the result is computed once per token for all
+        formats. If normalized is True, the result of function is already
+        in udnorm (see normalized_formats of the langtool), so that it is
+        not normalized again.
+        '''
+        plan = []
+        for form, sett in self.text_formats.items():
+            if (sett['before_replace'] == True) != before_replace:
+                continue
+            if form in self.batch_formats:
+                plan.append((form, None, (), None, False))
+                continue
+            function, args, source = sett['function'], self.format_args.get(form, ()), None
+            # Only functions of a langtool itself can be derived or normalized
+            owner = getattr(function, '__self__', self.langtool)
+            name = getattr(function, '__name__', None)
+            if name is None or getattr(owner, name, None) != function:
+                plan.append((form, function, args, source, False))
+                continue
+            if name in getattr(owner, 'derived_formats', {}) and not args:
+                source_name, name = owner.derived_formats[name]
+                source, function = getattr(owner, source_name), getattr(owner, name)
+            norm = getattr(owner, 'normalized_formats', {}).get(name, False)
+            normalized = norm is not False and (norm or owner.udnorm) == self.udnorm
+            plan.append((form, function, args, source, normalized))
+        return tuple(plan)
+
+    def runPlan(self, plan, token, token_processed):
+        '''Assigns the formats of a plan (see formatPlan()) of token'''
+        results = {}
+        for form, function, args, source, normalized in plan:
+            if function is None:
+                token_processed[form] = None  # Assigned after all tokens have been processed
+                continue
+            if source is None:
+                value = results[function] = function(token, *args)
+            else:
+                if source not in results:
+                    results[source] = source(token)
+                value = function(results[source])
+            token_processed[form] = value if normalized else normalize(self.udnorm, value)
+
+    def betacodeSummary(self):
+        stats = self.betacode_stats
+        if not stats['beta_nodes']:
+            return f'absent (betacode conversion skipped for {stats["tokens"]} tokens)'
+        return f'present in {stats["beta_nodes"]} of {stats["nodes"]} text nodes ' \
+               f'(betacode conversion skipped for {stats["tokens"] - stats["beta_tokens"]} of {stats["tokens"]} tokens)'
+
+    def process_token(self, t, replace_args):
+        '''Processes the text formats and features of a single token,
+        or of the tokens that the replace function makes of it
+
+        returns ((token, token_processed), ...)
+        '''
+        processed = []
+        # Check formats that need to be processed BEFORE the replacement function runs
+        beforeReplaceAssigned = False
+        form_dict = {}
+        self.runPlan(self.before_plan, t, form_dict)
+
+        # NB The replace_func might return multiple tokens if words are split like greek crasis forms
+        for token in self.replace_func(t, **replace_args):
+            token_processed = {}
+
+            # Assign pre-replace formats
+            if not beforeReplaceAssigned:
+                for form in form_dict:
+                    token_processed[form] = form_dict[form]
+                beforeReplaceAssigned = True
+            else:
+                for form in form_dict:
+                    token_processed[form] = ''
+
+            # Process text data
+            self.runPlan(self.after_plan, token, token_processed)
+
+            # Process feature data
+            for i, part in self.featuresInd:
+                token_processed[part] = token[i]
+            processed.append((token, token_processed))
+        return tuple(processed)
+
+    def tokenCacheSummary(self):
+        '''Returns the statistics of the token cache for this conversion'''
+        hits, misses, evictions = (new - old for new, old in zip(
+            (tokenCache.hits, tokenCache.misses, tokenCache.evictions), self.token_cache_stats))
+        return statsSummary(hits, misses, evictions, used=f'{len(tokenCache)} entries, '
+                            f'{tokenCache.bytes / 2**20:.1f} of {tokenCache.maxbytes / 2**20:.1f} MB')
+
     def process_text(self, text):
         # Normalise text according to the defined udnorm
         text = normalize(self.udnorm, text)
@@ -71,8 +217,22 @@ class Conversion:
             else:
                 text, self.res_text = '', text.strip()
 
+        # Detect betacode once per text node; without betacode
+        # the replace function can skip the betacode conversion
+        replace_args = {}
+        if self.detect_betacode:
+            replace_args['betacode'] = self.langtool.hasBetacode(text)
+            self.betacode_stats['nodes'] += 1
+            if replace_args['betacode']:
+                self.betacode_stats['beta_nodes'] += 1
+        if self.supply_accents:
+            replace_args['supply_accents'] = True
+
         # Handle punctuation that still does not belong to a word
         punc = ''
+        # Tokens (and their output) of which the batch formats still need to be processed
+        batch_tokens = []
+        batch_output = []
 
         # Process text
         for t in self.tokenizer(text, **self.tokenizer_args):
@@ -87,46 +247,39 @@ class Conversion:
                 pre = punc + pre
                 punc = ''
 
-            # Check formats that need to be processed BEFORE the replacement function runs
-            beforeReplaceAssigned = False
-            form_dict = {}
-            for form, sett in self.text_formats.items():
-                if sett['before_replace'] == True:
-                    form_dict[form] = normalize(
-                        self.udnorm, sett['function'](t))
-
-            # NB The replace_func might return multiple tokens if words are split like greek crasis forms
-            for token in self.replace_func(t):
-                token_processed = {}
-
-                # Assign pre-replace formats
-                if not beforeReplaceAssigned:
-                    for form in form_dict:
-                        token_processed[form] = form_dict[form]
-                    beforeReplaceAssigned = True
-                else:
-                    for form in form_dict:
-                        token_processed[form] = ''
-
-                # Process text data
-                for form, sett in self.text_formats.items():
-                    if form not in token_processed:  # Prevent the replacement of pre-replace formats
-                        # Special treatment of the lemma format, since it requires a lemmatizer argument
-                        if not form == 'lemma':
-                            token_processed[form] = normalize(
-                                self.udnorm, sett['function'](token))
-                        else:
-                            token_processed[form] = normalize(
-                                self.udnorm, sett['function'](token, self.lemmatizer))
-
-                # Process feature data
-                for i, part in self.featuresInd:
-                    token_processed[part] = token[i]
+            if self.detect_betacode:
+                self.betacode_stats['tokens'] += 1
+                if replace_args['betacode']:
+                    self.betacode_stats['beta_tokens'] += 1
 
+            # The output of a recurring token is taken from the token cache;
+            # since it is shared (and the directors may change it), every occurrence gets a copy
+            if self.token_cache is None:
+                processed = self.process_token(t, replace_args)
+            else:
+                found, processed = self.token_cache.get(t)
+                if not found:
+                    processed = self.process_token(t, replace_args)
+                    self.token_cache.put(t, processed)
+
+            for token, token_processed in processed:
+                if self.token_cache is not None:
+                    token_processed = token_processed.copy()
                 # Append dict to output list
                 text_output.append(token_processed)
+                if self.batch_formats:
+                    batch_tokens.append(token)
+                    batch_output.append(token_processed)
+
+        # Process the batch formats for all tokens at once
+        for form in self.batch_formats:
+            sett = self.text_formats[form]
+            args = self.format_args.get(form, ())
+            for token_processed, value in zip(batch_output, sett['batch_function'](batch_tokens, *args)):
+                token_processed[form] = normalize(self.udnorm, value)
 
         # Output list of dicts with text and feature data to be assigned to slot nodes
+        self.token_count += len(text_output)
         return text_output
 
 
@@ -197,7 +350,7 @@ class Csv2tf(Conversion):
         counter = self.struct_counter.copy()
         udnorm = self.udnorm                   # define the Unicode norm used
         # keep track of wordforms converted successfully to lemmata
-        lemma_counter = [0, 0]
+        lemma_counter = [0, 0, 0]
         cur = {}                            # keep track of node number assignments
 
         # VARIABLES TO PROCESS PREPROCESSED TLG-E OUTPUT
@@ -379,6 +532,8 @@ class Csv2tf(Conversion):
                         lemma_counter[1] += 1
                     else:
                         lemma_counter[0] += 1
+                        if token_out['lemma'].startswith('~'):
+                            lemma_counter[2] += 1
 
         # In case the csv-file has a header, but is empty:
         # assign one empty slot in case of ignore_empty == False
@@ -405,9 +560,16 @@ class Csv2tf(Conversion):
                 cv.terminate(cur[ntp])
 
         # Calculate lemmatizer coverage of lemmata
-        if not lemma_counter == [0, 0]:
+        if not lemma_counter == [0, 0, 0]:
             cv.meta(
                 'lemma', **{'coverage_ratio': f'{round(lemma_counter[0] / ((lemma_counter[0] + lemma_counter[1]) / 100 ), 2)}%'})
+            if lemma_counter[2]:
+                cv.meta(
+                    'lemma', **{'fuzzy_ratio': f'{round(lemma_counter[2] / ((lemma_counter[0] + lemma_counter[1]) / 100 ), 2)}%'})
+
+        # Record whether betacode has been found in the text
+        if self.detect_betacode:
+            cv.meta('', betacode=self.betacodeSummary())
 
         # Assign the correct valueType to features
         for feature in cv.metaData:
@@ -421,10 +583,12 @@ class Csv2tf(Conversion):
 
 
 class Xml2tf(Conversion):
-    def __init__(self, data, **kwargs):
+    def __init__(self, data, attribs_data=None, **kwargs):
+        # NB if data is an iterator, the attributes need to be analyzed
+        # in a separate prepass over the body, given by attribs_data
         super().__init__(data, **kwargs)
         self.analyzed_dict,         self.sections = attribsAnalysis(
-            self.data, **kwargs)
+            self.data if attribs_data is None else attribs_data, **kwargs)
         self.structs = tuple(
             ('_book',) + tuple(self.sections) + tuple(self.struct_counter))
 
@@ -447,7 +611,7 @@ class Xml2tf(Conversion):
         counter = self.struct_counter.copy()
         udnorm = self.udnorm                   # define the Unicode norm used
         # keep track of wordforms converted successfully to lemmata
-        lemma_counter = [0, 0]
+        lemma_counter = [0, 0, 0]
         cur = {}                            # keep track of node number assignments
         tagList = []			     # keep track of the XML tags
         # keep track of features that are linked together
@@ -567,6 +731,8 @@ class Xml2tf(Conversion):
                             lemma_counter[1] += 1
                         else:
                             lemma_counter[0] += 1
+                            if token_out['lemma'].startswith('~'):
+                                lemma_counter[2] += 1
 
             elif code == 'closeTag':
                 if tagList[-1] in self.sections:
@@ -710,9 +876,15 @@ class Xml2tf(Conversion):
                     del tagList[-1]
                 break
 
-        if not lemma_counter == [0, 0]:
+        if not lemma_counter == [0, 0, 0]:
             cv.meta(
                 'lemma', **{'coverage_ratio': f'{round(lemma_counter[0] / ((lemma_counter[0] + lemma_counter[1]) / 100 ), 2)}%'})
+            if lemma_counter[2]:
+                cv.meta(
+                    'lemma', **{'fuzzy_ratio': f'{round(lemma_counter[2] / ((lemma_counter[0] + lemma_counter[1]) / 100 ), 2)}%'})
+        # Record whether betacode has been found in the text
+        if self.detect_betacode:
+            cv.meta('', betacode=self.betacodeSummary())
         cv.meta(
             '_sentence', description=f"sentences defined by the following delimiters: {self.sentence_delimit}",)
         cv.meta(
@@ -734,6 +906,346 @@ class Xml2tf(Conversion):
 #             tm.info(str(len(tagList)) + ' tag error(s) found.')
 
 
+# The outcome of the conversion of a single file (see processFile()); status is one of
+# 'converted', 'failed' (no slots), 'skipped' (no body or existing output), 'ignored'
+# (no csv, tsv or xml), 'error' (an exception, of which the message is in error) or
+# 'aborted' (the file exceeded its budget or its worker died, see runWorkers()).
+# start_rss is the resident memory of the process at the start of the file;
+# worker_peak_rss is the peak of the process so far, which may belong to an earlier
+# file of the same worker; caches has the (hits, misses, evictions) of the file per cache,
+# accents the accentuations that have been computed for the file (see Greek.takeAccents());
+# both are None for a file that has been ignored or aborted
+FileResult = namedtuple('FileResult', ('file', 'status', 'tokens', 'slots', 'seconds', 'start_rss',
+                                       'worker_peak_rss', 'error', 'output', 'caches', 'accents'),
+                        defaults=(0, 0, 0.0, 0, 0, '', '', None, None))
+
+
+# The settings of the running conversion (see convert()), as read-only mappings:
+# convertSettings are the langsettings that are passed to the Conversion,
+# convertOptions the arguments of convert() that are needed per file;
+# they are set by initConvert(), in the parent and in every worker
+convertSettings = None
+convertOptions = None
+
+
+def initConvert(settings, options):
+    '''Sets convertSettings and convertOptions for processFile(), and
+    applies the settings that are kept in the state of the process,
+    like the sizes of the caches; it is the initializer of the workers,
+    so that the settings are passed explicitly, whatever the start
+    method of the workers
+    '''
+    global convertSettings, convertOptions
+    convertSettings = MappingProxyType({**settings, 'generic': MappingProxyType(dict(settings['generic']))})
+    convertOptions = MappingProxyType(options)
+    langtool = settings['langtool']
+
+    # Enable the fuzzy lemma fallback of the langtool (if any)
+    if 'fuzzy_distance' in settings and hasattr(langtool, 'fuzzy_distance'):
+        if langtool.fuzzy_distance != settings['fuzzy_distance']:
+            langtool.fuzzy_distance = settings['fuzzy_distance']
+            langtool.lemma_cache.clear()
+
+    # Set the sizes of the caches of the langtool (if any)
+    for cache in langtool.caches:
+        if f'{cache}_size' in settings:
+            getattr(langtool, cache).resize(settings[f'{cache}_size'])
+    # The output of the tokens depends on the settings, so that the
+    # token cache is cleared for every conversion
+    tokenCache.clear()
+    tokenCache.resize(sys.maxsize, settings.get('token_cache_bytes', 0))
+
+    # Accentuations are kept across runs, since they are slow to compute
+    if settings.get('supply_accents') and hasattr(langtool, 'loadAccents'):
+        langtool.loadAccents()
+
+
+def peakRSS():
+    '''Returns the peak resident memory of the current process in bytes'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cacheStats(langtool):
+    '''Returns the statistics (hits, misses, evictions) of the attribute
+    cache and of the caches of the langtool, per cache
+    '''
+    stats = {'attribute cache': attribCache.stats()}
+    for cache in langtool.caches:
+        stats[cache.replace('_', ' ')] = getattr(langtool, cache).stats()
+    return stats
+
+
+def processFile(file):
+    '''Converts a single file with convertSettings and convertOptions
+
+    It is a top-level function, so that it can be used by the workers
+    of runWorkers(). The metadata of the file are added to a copy of the
+    generic metadata, so that nothing is carried over to the next file.
+    Exceptions are caught and reported in the result, so that a single
+    file does not stop the conversion of the others. The start and the
+    result of the conversion are recorded in the journal of the output.
+
+    returns a FileResult
+    '''
+    start = time()
+    start_rss = processRSS(getpid()) or 0
+    if not file.endswith(('.csv', '.tsv', '.xml')):
+        return FileResult(file, 'ignored', seconds=time() - start, start_rss=start_rss, worker_peak_rss=peakRSS())
+    stats = cacheStats(convertSettings['langtool'])
+
+    # The start and the result of the conversion are written to the journal;
+    # the content has been hashed by the parent already in an incremental run
+    filepath = path.abspath(file)
+    entry = {'file': filepath, 'content_hash': convertOptions['hashes'].get(filepath) or fileHash(file),
+             'config_hash': convertOptions['config_hash']}
+    output = None
+
+    def started(TF_PATH):
+        nonlocal output
+        output = TF_PATH
+        appendJournal(convertOptions['journal'], **entry, output=output, status='started')
+
+    try:
+        status, x, cv, output = convertFile(file, convertSettings, convertOptions, started=started)
+    except Exception as error:
+        convertOptions['tm'].error(f'   |    conversion of {file.split("/")[-1]} raised {error!r}\n', tm=False)
+        status, x, cv, error = 'error', None, None, repr(error)
+    else:
+        error = ''
+    # The statistics of the caches of the file, to be summed by the parent
+    caches = {cache: tuple(after - before for after, before in zip(counts, stats[cache]))
+              for cache, counts in cacheStats(convertSettings['langtool']).items()}
+    # The new accentuations are returned to the parent, that keeps them for later runs
+    langtool = convertSettings['langtool']
+    accents = langtool.takeAccents() if convertSettings.get('supply_accents') and hasattr(langtool, 'takeAccents') else {}
+    result = FileResult(file, status, tokens=x.token_count if x else 0, slots=cv.curSeq[x.slot_type] if x else 0,
+                        seconds=time() - start, start_rss=start_rss, worker_peak_rss=peakRSS(),
+                        error=error, output=output or '', caches=caches, accents=accents)
+    appendJournal(convertOptions['journal'], **entry, output=output, status=result.status)
+    return result
+
+
+def abortedFile(file, seconds, rss, reason):
+    '''Returns the FileResult of a file of which the conversion has
+    been aborted by runWorkers()
+    '''
+    return FileResult(file, 'aborted', seconds=seconds, worker_peak_rss=rss, error=reason)
+
+
+def retryPath(file, options):
+    '''Returns the output path of an earlier attempt to convert a file
+    that is retried (see convert(resume=True)), after clearing what
+    the earlier attempt has written; otherwise None
+    '''
+    TF_PATH = options['outputs'].get(path.abspath(file))
+    if TF_PATH and path.isdir(TF_PATH):
+        shutil.rmtree(TF_PATH)
+    return TF_PATH
+
+
+def outputDirs(metadata, dir_struct):
+    '''Returns the directories of the output of a file on the basis of
+    its metadata; dir_struct is a list of lists of which the tagnames
+    used are defined in config.py, they usually correspond to something
+    like (author, work, editor/edition)
+    '''
+    dirs = []
+    for i in dir_struct:
+        for j in i:
+            if j in metadata:
+                dirs.append(metadata[j])
+                break
+        else:
+            dirs.append(f'unknown {"-".join(i)}')
+    return dirs
+
+
+def convertFile(file, settings, options, started=None):
+    '''Converts a single file; settings are the langsettings of the
+    conversion, options the arguments of convert(); started(output)
+    is called once the output path of the file is known
+
+    returns (status, conversion, cv, output), of which conversion,
+    cv and output are None if the file has not been converted
+    '''
+    tm = options['tm']
+    outpath = options['outpath']
+    version = options['version']
+    silent = options['silent']
+    if file.endswith('.csv') or file.endswith('.tsv'):
+        tm.info(f'parsing {file}')
+        filename = path.splitext(file)[0].split('/')[-1]
+
+        # Create csv-object that tests for header and dialect
+        sniffer = csv.Sniffer()
+        with open(file, newline='') as csvfile:
+            test_piece = csvfile.read(1024)
+            # Reset the cursor at starting position after read()
+            csvfile.seek(0)
+            # Define dialect
+            dialect = sniffer.sniff(test_piece)
+            # Automatically define the presence of a header, if header == None
+            header = options['header']
+            if header == None:
+                header = sniffer.has_header(test_piece)
+            data = csv.reader(csvfile, dialect, delimiter=options['csv_delimiter'])
+            first_line = next(data)
+            csvfile.seek(0)
+
+            # Inject metadata
+            metadata = tlge_metadata[filename]
+            generic = {**settings['generic'], **metadata}
+
+            # Add original filename to metadata
+            generic['filename'] = filename
+            if not 'title' in generic:
+                generic['title'] = filename.rsplit('.', 1)[0]
+
+            if options['tlg_out'] == True:
+                dirs = generic['key'].split(' ')
+            # definition of output dir structure on the basis of metadata
+            else:
+                dirs = outputDirs(metadata, settings['dir_struct'])
+
+            # A retried file is written to the output path of its earlier attempt;
+            # otherwise, in case of multiple editions of the same work, a number will be prefixed
+            TF_PATH = retryPath(file, options)
+            C = 1
+            if TF_PATH:
+                pass
+            elif path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
+                # Pass if dir already exists --> temporary solution!!!
+                return 'skipped', None, None, None
+
+                while path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
+                    C += 1
+                else:
+                    TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
+            else:
+                TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
+            if started:
+                started(TF_PATH)
+
+            # setting up the text-fabric engine
+            TF = Fabric(locations=TF_PATH, silent=silent)
+            cv = CV(TF, silent=silent)
+            # initiating the Conversion class that provides all
+            # necessary data and methods for cv.walk()
+            x = Csv2tf(data, first_line=first_line, **{**settings, 'generic': generic, 'header': header})
+            # running cv.walk() to generate the tf-files
+            good = cv.walk(
+                x.director,
+                slotType=x.slot_type,
+                otext=x.otext,
+                generic=x.generic,
+                intFeatures=x.intFeatures,
+                featureMeta=x.featureMeta,
+                warn=True,
+            )
+            if x.detect_betacode:
+                tm.info(f'   |    betacode {x.betacodeSummary()}')
+            if x.token_cache is not None:
+                tm.info(f'   |    token cache {x.tokenCacheSummary()}')
+            if good:
+                tm.info('   |    Conversion was successful...\n')
+            else:
+                tm.info(
+                    '   |    Unfortunately, conversion was not successful...')
+                if settings['ignore_empty'] == True:
+                    tm.info(
+                        '   |    The most probable reason is that no slot numbers could be assigned...\n')
+            return 'converted' if good else 'failed', x, cv, TF_PATH
+
+    elif file.endswith('.xml'):
+        tm.info(f'parsing {file}')
+        lang = settings['lang']
+
+        # creation of a stream of events to extract metadata
+        # and to inject later into the Conversion object
+        # NB metadataReader consumes the header, so that
+        # data continues with the events of the body
+        data = dataParser(xmlSplitter(file), lang=lang)
+        body_index, metadata = metadataReader(
+            data, **settings['xmlmetadata'])
+        if not body_index:
+            data.close()
+            return 'skipped', None, None, None
+        generic = {**settings['generic'], **metadata}
+        # Add filename
+        filename = path.splitext(file)[0].split('/')[-1]
+        generic['filename'] = filename
+
+        # definition of output dir structure on the basis of metadata or tlg-out
+        if options['tlg_out'] == True:
+            dirs = file.split('/')[-1].split('.')[:3]
+        else:
+            dirs = outputDirs(metadata, settings['dir_struct'])
+
+        # A retried file is written to the output path of its earlier attempt;
+        # otherwise, in case of multiple editions of the same work, a number will be prefixed
+        TF_PATH = retryPath(file, options)
+        C = 1
+        if TF_PATH:
+            pass
+        elif path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
+            while path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
+                C += 1
+            else:
+                TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
+        else:
+            TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
+        if started:
+            started(TF_PATH)
+
+        # setting up the text-fabric engine
+        TF = Fabric(locations=TF_PATH, silent=silent)
+        cv = CV(TF, silent=silent)
+        # initiating the Conversion class that provides all
+        # necessary data and methods for cv.walk()
+        # The attributes of the body are analyzed in advance, in a second
+        # pass over the file; it only parses the attribute tags of the body
+        attribs_data = bodyAttribEvents(xmlSplitter(file), lang=lang)
+        x = Xml2tf(data, attribs_data=attribs_data, **{**settings, 'generic': generic})
+        # running cv.walk() to generate the tf-files
+        good = cv.walk(
+            x.director,
+            slotType=x.slot_type,
+            otext=x.otext,
+            generic=x.generic,
+            intFeatures=x.intFeatures,
+            featureMeta=x.featureMeta,
+            warn=True,
+        )
+        data.close()
+        if x.detect_betacode:
+            tm.info(f'   |    betacode {x.betacodeSummary()}')
+        if x.token_cache is not None:
+            tm.info(f'   |    token cache {x.tokenCacheSummary()}')
+        if good:
+            tm.info(
+                f'   |    Conversion of {file.split("/")[-1]} was successful...!\n')
+        else:
+            tm.info(
+                f'   |    Unfortunately, conversion of {file.split("/")[-1]} was not successful...\n')
+        return 'converted' if good else 'failed', x, cv, TF_PATH
+
+    return 'ignored', None, None, None
+
+
+def convertSummary(results):
+    '''Returns a summary of the FileResults of a conversion'''
+    results = [result for result in results if result.status != 'ignored']
+    tokens = sum(result.tokens for result in results)
+    seconds = sum(result.seconds for result in results)
+    statuses = {status: sum(result.status == status for result in results)
+                for status in ('failed', 'skipped', 'error', 'aborted')}
+    return f'{tokens} tokens in {sum(result.slots for result in results)} slots; ' \
+        f'{round(seconds, 2)} s of work, {round(tokens / seconds) if seconds else 0} tokens/s; ' \
+        f'peak RSS {round(max((result.worker_peak_rss for result in results), default=0) / 2**20, 1)} MB; ' \
+        + ', '.join(f'{count} {status}' for status, count in statuses.items())
+
+
+
 # MAIN CONVERT FUNCTION THAT INVOKES ALL THE MACHINERY ABOVE
 def convert(
         input_path,
@@ -752,8 +1264,22 @@ def convert(
         version='1.0',                  # Version number to be added in the metadata of every tf-file
         langsettings=langsettings,      # Reference to langsettings
         multiprocessing=False,          # Can be used if many files need to be converted. If 'True', the program checks number of available cores authomatically; if int, it will try to use that number of cores
-        # Defines the number of files to be send to each core in multiprocessing mode
+        # No longer used: in multiprocessing mode the files are sent one by one to the first idle worker
         chunksize=1,
+        # In multiprocessing mode, a worker is replaced by a fresh one after recycle_after files
+        # or once its resident memory exceeds recycle_rss bytes (to return the memory of large files)
+        recycle_after=None,
+        recycle_rss=None,
+        # In multiprocessing mode, a file is aborted if it takes more than file_timeout seconds
+        # or if the resident memory of its worker grows by more than file_rss bytes during the file; the other files are not affected
+        file_timeout=None,
+        file_rss=None,
+        # Path of the timings of the files; if given, they are kept across runs to refine the order of the files in multiprocessing mode
+        timings=None,
+        # If True, the files that have been completed according to the journal in output_path are skipped, and the others are retried
+        resume=False,
+        # If True, only the files of which the content or the settings have changed since their last conversion are converted (in place)
+        incremental=False,
         silent=False,                   # Keeps TF messages silent
 ):
     '''The convert function is the core of the tei2tf module
@@ -764,13 +1290,15 @@ def convert(
     **kwargs: a dictionary that is usually derived from the
               config.py file, that contains all important
               parameters for the conversion (see documentation)
+
+    returns a list of FileResults, one per file of in_path that has
+    been processed in this run: with resume=True, the files that have
+    been completed before are left out, and with incremental=True the
+    files that are up to date (these are only counted in the log)
     '''
     tm = Timestamp()
     kwargs = langsettings[lang]
-    dir_struct = kwargs['dir_struct']
 #    sLemmatizer  = kwargs['lemmatizer']()
-    count1 = 0     # counts the number input files
-    count2 = 0     # counts the number of successfully processed files
 
     # Add parameters to kwargs
     kwargs['ignore_empty'] = ignore_empty
@@ -779,10 +1307,33 @@ def convert(
     kwargs['typ'] = typ
     kwargs['header'] = header
     kwargs['version'] = version
+    kwargs['supply_accents'] = supply_accents
 
     if kwargs['lang'] == 'greek':
         kwargs['lemmatizer'] = langsettings['greek']['slemmatizer']()
 
+    # The morphology is only loaded if the morph format is used
+    load_morphology = 'morph' in kwargs['text_formats'] and kwargs.get('smorphology')
+    if load_morphology:
+        kwargs['morphology'] = kwargs['smorphology']()
+
+    # The settings are hashed before the indexes are shared, so that
+    # the hash is the same with and without multiprocessing
+    options = {'tlg_out': tlg_out, 'csv_delimiter': csv_delimiter, 'header': header, 'version': version}
+    config_hash = configHash(kwargs, options)
+
+    # Workers need to share the lemmatizer and the morphology,
+    # instead of getting a copy of them each
+    if multiprocessing:
+        if kwargs['lang'] == 'greek':
+            kwargs['lemmatizer'] = shareLemmatizer(kwargs['lemmatizer'])
+        if load_morphology:
+            kwargs['morphology'] = shareLemmatizer(kwargs['morphology'])
+
+    # Accentuations are kept across runs, since they are slow to compute
+    if supply_accents and hasattr(kwargs['langtool'], 'loadAccents'):
+        kwargs['langtool'].loadAccents()
+
     # input-output file management
     if input_path.startswith('~'):
         inpath = path.expanduser(input_path)
@@ -793,188 +1344,99 @@ def convert(
     else:
         outpath = output_path
 
-    # Necessary to make process_file picklable for multiprocessing
-    global process_file
-
-    def process_file(file):
-        nonlocal count1
-        nonlocal count2
-        nonlocal header
-#         nonlocal silent
-        if file.endswith('.csv') or file.endswith('.tsv'):
-            count1 += 1
-            tm.info(f'parsing {file}')
-            filename = path.splitext(file)[0].split('/')[-1]
-
-            # Create csv-object that tests for header and dialect
-            sniffer = csv.Sniffer()
-            with open(file, newline='') as csvfile:
-                test_piece = csvfile.read(1024)
-                # Reset the cursor at starting position after read()
-                csvfile.seek(0)
-                # Define dialect
-                dialect = sniffer.sniff(test_piece)
-                # Automatically define the presence of a header, if header == None
-                if header == None:
-                    header = sniffer.has_header(test_piece)
-                data = csv.reader(csvfile, dialect, delimiter=csv_delimiter)
-                first_line = next(data)
-                csvfile.seek(0)
-
-                # Inject metadata
-                metadata = tlge_metadata[filename]
-                kwargs['generic'].update(tlge_metadata[filename])
-                
-                # Add original filename to metadata
-                kwargs['generic']['filename'] = filename
-                if not 'title' in kwargs['generic']:
-                    kwargs['generic']['title'] = filename.rsplit('.', 1)[0]
-
-                if tlg_out == True:
-                    dirs = kwargs['generic']['key'].split(' ')
-                # definition of output dir structure on the basis of metadata
-                else:
-                    dirs = []
-                    for i in dir_struct:
-                        assigned = False
-                        for j in i:
-                            if j in metadata:
-                                dirs.append(metadata[j])
-                                assigned = True
-                                break
-                        if assigned == False:
-                            dirs.append(f'unknown {"-".join(i)}')
-
-                # dirs is a list of lists of which the tagnames used are defined in config.py
-                # they usually correspond to something like (author, work, editor/edition)
-                # in case of multiple editions of the same work, a number will be prefixed
-                C = 1
-                if path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
-                    # Pass if dir already exists --> temporary solution!!!
-                    return False
-
-                    while path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
-                        C += 1
-                    else:
-                        TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
-                else:
-                    TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
+    # Define list of files to be processed; sorted, so that a
+    # conversion processes the files in the same order every time
+    file_list = sorted(glob(f'{inpath}/**/*{file_elem}*.*', recursive=True))
+    # print(file_list)
 
-                # setting up the text-fabric engine
-                TF = Fabric(locations=TF_PATH, silent=silent)
-                cv = CV(TF, silent=silent)
-                # initiating the Conversion class that provides all
-                # necessary data and methods for cv.walk()
-                x = Csv2tf(data, first_line=first_line, **kwargs)
-                # running cv.walk() to generate the tf-files
-                good = cv.walk(
-                    x.director,
-                    slotType=x.slot_type,
-                    otext=x.otext,
-                    generic=x.generic,
-                    intFeatures=x.intFeatures,
-                    featureMeta=x.featureMeta,
-                    warn=True,
-                )
-                # Count number of successfully converted files
-                if good:
-                    count2 += 1
-                    tm.info('   |    Conversion was successful...\n')
-                else:
-                    tm.info(
-                        '   |    Unfortunately, conversion was not successful...')
-                    if ignore_empty == True:
-                        tm.info(
-                            '   |    The most probable reason is that no slot numbers could be assigned...\n')
-
-        elif file.endswith('.xml'):
-            count1 += 1
-#             if count1 > 1: print('\n')
-            tm.info(f'parsing {file}')
-
-            # creation of data to extract metadata
-            # and to inject later into the Conversion object
-            data = dataParser(xmlSplitter(file), lang=lang)
-            body_index, metadata = metadataReader(
-                data, **kwargs['xmlmetadata'])
-            if not body_index:
-                return False
-            kwargs['generic'].update(metadata)
-            # Add filename
-            filename = path.splitext(file)[0].split('/')[-1]
-            kwargs['generic']['filename'] = filename
-
-            # definition of output dir structure on the basis of metadata or tlg-out
-            if tlg_out == True:
-                dirs = file.split('/')[-1].split('.')[:3]
-            else:
-                dirs = []
-                for i in dir_struct:
-                    assigned = False
-                    for j in i:
-                        if j in metadata:
-                            dirs.append(metadata[j])
-                            assigned = True
-                            break
-                    if assigned == False:
-                        dirs.append(f'unknown {"-".join(i)}')
-
-            # dirs is a list of lists of which the tagnames used are defined in config.py
-            # they usually correspond to something like (author, work, editor/edition)
-            # in case of multiple editions of the same work, a number will be prefixed
-            C = 1
-            if path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
-                while path.isdir(f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'):
-                    C += 1
-                else:
-                    TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
-            else:
-                TF_PATH = f'{outpath}/{"/".join(dirs)}/{C}/tf/{version}'
+    # The start and the result of the conversion of every file
+    # are recorded in the journal in the output root
+    makedirs(outpath, exist_ok=True)
+    journal = path.join(outpath, JOURNAL)
+
+    # If a conversion is resumed, the files that have been completed before are skipped;
+    # if it is incremental, only if their content and settings have not changed since.
+    # The other files are (re)converted to the output path of their last attempt.
+    # The hashes of the contents are passed on, so that they are computed once
+    outputs = {}
+    hashes = {}
+    if resume or incremental:
+        entries = readJournal(journal)
+        last = lastEntries(entries)
+        outputs = lastOutputs(entries)
+        if incremental:
+            hashes = {path.abspath(file): fileHash(file) for file in file_list
+                      if file.endswith(('.csv', '.tsv', '.xml'))}
+            completed = {file for file, content_hash in hashes.items()
+                         if upToDate(last.get(file), content_hash, config_hash)}
+        else:
+            completed = {file for file, entry in last.items() if entry['status'] in COMPLETED}
+        previous = len(file_list)
+        file_list = [file for file in file_list if path.abspath(file) not in completed]
+        tm.info(f'{"incremental" if incremental else "resuming"}: '
+                f'{previous - len(file_list)} of {previous} files have been completed before')
 
-            # setting up the text-fabric engine
-            TF = Fabric(locations=TF_PATH, silent=silent)
-            cv = CV(TF, silent=silent)
-            # initiating the Conversion class that provides all
-            # necessary data and methods for cv.walk()
-            x = Xml2tf(data[body_index:], **kwargs)
-            # running cv.walk() to generate the tf-files
-            good = cv.walk(
-                x.director,
-                slotType=x.slot_type,
-                otext=x.otext,
-                generic=x.generic,
-                intFeatures=x.intFeatures,
-                featureMeta=x.featureMeta,
-                warn=True,
-            )
-            # Count number of successfully converted files
-            if good:
-                count2 += 1
-                tm.info(
-                    f'   |    Conversion of {file.split("/")[-1]} was successful...!\n')
-            else:
-                tm.info(
-                    f'   |    Unfortunately, conversion of {file.split("/")[-1]} was not successful...\n')
+    # The settings are fixed for all files; every file gets its own
+    # copy of the generic metadata (see processFile())
+    settings = {**kwargs, 'generic': dict(generic)}
+    options = {**options, 'tm': tm, 'outpath': outpath, 'silent': silent,
+               'journal': journal, 'config_hash': config_hash, 'outputs': outputs, 'hashes': hashes}
 
-    # Define list of files to be processed
-    file_list = glob(f'{inpath}/**/*{file_elem}*.*', recursive=True)
-    # print(file_list)
+    # The timings of earlier runs (if any) refine the estimated costs of the files
+    earlier = loadTimings(timings) if timings else {}
 
     if multiprocessing:
         if not type(multiprocessing) == bool:
             # Manual assignment of cores
-            pool = Pool(processes=multiprocessing)
+            workers = multiprocessing
         else:
-            pool = Pool()
-        # Manual assignment of chunksize if many files need to be consumed
-        # Manual assignment might improve performance
-        pool.imap_unordered(process_file, file_list, chunksize=chunksize)
-    #     pool.imap_unordered(process_file, file_list)
-        pool.close()
-        pool.join()
-
+            workers = cpu_count()
+        # The files are dispatched in longest-processing-time-first order,
+        # so that the largest works do not start last
+        file_list = lptOrder(file_list, estimateCosts(file_list, earlier))
+        start = time()
+        results = []
+        for result in runWorkers(processFile, file_list, workers,
+                                 initializer=initConvert, initargs=(settings, options),
+                                 recycle_after=recycle_after, recycle_rss=recycle_rss,
+                                 file_timeout=file_timeout, file_rss=file_rss, failed=abortedFile):
+            if result.status == 'aborted':
+                tm.info(f'   |    Conversion of {result.file.split("/")[-1]} was aborted: {result.error}\n')
+                appendJournal(journal, file=path.abspath(result.file),
+                              content_hash=hashes.get(path.abspath(result.file)) or fileHash(result.file),
+                              config_hash=config_hash, output=None, status='aborted')
+            results.append(result)
+        tm.info(f'scheduling: {makespanSummary(time() - start, [result.seconds for result in results], workers)}')
     else:
-        for file in file_list:
-            process_file(file)
+        initConvert(settings, options)
+        results = [processFile(file) for file in file_list]
+    if timings:
+        saveTimings(timings, earlier, results)
 
+    count1 = sum(result.status != 'ignored' for result in results)
+    count2 = sum(result.status == 'converted' for result in results)
     tm.info(f'{count2} of {count1} works have successfully been converted!')
+    tm.info(f'conversion: {convertSummary(results)}')
+    for result in results:
+        if result.status in ('error', 'aborted'):
+            tm.info(f'   |    {result.file}: {result.error}')
+    if hasattr(kwargs.get('lemmatizer'), 'close'):
+        kwargs['lemmatizer'].close()
+    if hasattr(kwargs.get('morphology'), 'close'):
+        kwargs['morphology'].close()
+    # The accentuations of the workers are merged before they are saved
+    if supply_accents and hasattr(kwargs['langtool'], 'saveAccents'):
+        for result in results:
+            if result.accents:
+                kwargs['langtool'].mergeAccents(result.accents)
+        kwargs['langtool'].saveAccents()
+    # The statistics of the caches are summed over the files, since
+    # in multiprocessing mode the caches are used by the workers only
+    caches = {}
+    for result in results:
+        for cache, counts in (result.caches or {}).items():
+            caches[cache] = tuple(map(sum, zip(caches.get(cache, (0, 0, 0)), counts)))
+    for cache, (hits, misses, evictions) in caches.items():
+        if hits or misses:
+            tm.info(f'{cache}: {statsSummary(hits, misses, evictions)}')
+    return results